@@ -1,12 +1,9 @@
-from shared.serializers import BaseSerializer
+from shared.serializers import BaseSerializer, Field
 
 
 class CategorySerializer(BaseSerializer):
-    def serialize_instance(self, instance) -> dict:
-        return {
-            'id': instance.pk,
-            'name': instance.name,
-            'slug': instance.slug,
-            'description': instance.description,
-            'color': instance.color,
-        }
+    id = Field('pk')
+    name = Field()
+    slug = Field()
+    description = Field()
+    color = Field()
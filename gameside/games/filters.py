@@ -0,0 +1,15 @@
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import Q
+
+from shared.filters import BooleanFilter, FilterSet, InFilter, RangeFilter, RelatedFilter
+
+
+class GameFilter(FilterSet):
+    category = RelatedFilter()
+    platform = RelatedFilter('platforms')
+    pegi = InFilter()
+    price = RangeFilter(cast=Decimal)
+    released = RangeFilter('released_at', cast=date.fromisoformat)
+    in_stock = BooleanFilter(Q(stock__gt=0), Q(stock=0))
@@ -0,0 +1,140 @@
+import heapq
+import math
+import sys
+from array import array
+from collections import Counter
+from itertools import accumulate
+from typing import Iterable, Iterator
+
+from .suggest import TitleIndex, fold
+
+# Share of the query's trigrams a title must contain to be a match
+THRESHOLD = 0.4
+# Only the rarest query trigrams are looked up: common ones ('the', ' of') cost time, not precision
+MAX_QUERY_TRIGRAMS = 8
+# Changed games are kept aside and merged into the postings once there are this many
+MERGE_AFTER = 1000
+
+Posting = tuple[int, array]
+
+
+def get_trigrams(text: str) -> frozenset[int]:
+    """Trigrams of each folded word padded with spaces (' ze', 'zel', ..., 'da ').
+
+    Each trigram is packed into one int (21 bits per code point).
+    """
+    trigrams = set()
+    for word in fold(text).split():
+        padded = f' {word} '
+        for i in range(len(padded) - 2):
+            a, b, c = padded[i : i + 3]
+            trigrams.add(ord(a) << 42 | ord(b) << 21 | ord(c))
+    return frozenset(trigrams)
+
+
+def encode(pks: list[int]) -> Posting:
+    # Sorted pks as (first pk, deltas), in the smallest array type that fits the deltas
+    deltas = [b - a for a, b in zip(pks, pks[1:])]
+    largest = max(deltas, default=0)
+    typecode = 'B' if largest < 1 << 8 else 'H' if largest < 1 << 16 else 'I'
+    return pks[0], array(typecode, deltas)
+
+
+def decode(posting: Posting) -> Iterator[int]:
+    first, deltas = posting
+    return accumulate(deltas, initial=first)
+
+
+class TrigramIndex(TitleIndex):
+    """Inverted index over Game.title: trigram -> delta-encoded sorted pks.
+
+    Between builds, Game save/delete signals record the game's new trigrams in `changes`, which
+    override the postings until they are merged in. `lengths[pk]` holds each title's trigram
+    count for similarity scoring, keyed by pk (so its size follows the number of games, not
+    the largest pk). Writers replace (never mutate) what readers use, so searches don't lock.
+    """
+
+    fields = ('pk', 'title')
+
+    def reset(self) -> None:
+        self.postings: dict[int, Posting] = {}
+        self.lengths: dict[int, int] = {}
+        self.changes: dict[int, frozenset[int]] = {}
+        super().reset()
+
+    def build(self, rows: Iterable[tuple[int, str]]) -> None:
+        lists, lengths = {}, {}
+        for pk, title in sorted(rows):
+            trigrams = get_trigrams(title)
+            lengths[pk] = len(trigrams)
+            for trigram in trigrams:
+                lists.setdefault(trigram, []).append(pk)
+        self.postings = {trigram: encode(pks) for trigram, pks in lists.items()}
+        self.lengths, self.changes, self.loaded = lengths, {}, True
+
+    def add(self, pk: int, title: str) -> None:
+        self._change(pk, get_trigrams(title))
+
+    def remove(self, pk: int) -> None:
+        self._change(pk, frozenset())
+
+    def _change(self, pk: int, trigrams: frozenset[int]) -> None:
+        if not self.loaded:
+            return
+        with self.lock:
+            self.changes = {**self.changes, pk: trigrams}
+            if len(self.changes) >= MERGE_AFTER:
+                self.merge()
+
+    def merge(self) -> None:
+        changes = self.changes
+        lengths = {pk: length for pk, length in self.lengths.items() if pk not in changes}
+        lists = {}
+        for trigram, posting in self.postings.items():
+            if pks := [pk for pk in decode(posting) if pk not in changes]:
+                lists[trigram] = pks
+        for pk, trigrams in changes.items():
+            if trigrams:
+                lengths[pk] = len(trigrams)
+            for trigram in trigrams:
+                lists.setdefault(trigram, []).append(pk)
+        self.postings = {trigram: encode(sorted(pks)) for trigram, pks in lists.items()}
+        self.lengths = lengths
+        self.changes = {}
+
+    def search(self, text: str, limit: int) -> list[int]:
+        """Up to `limit` pks, best first: by query coverage, then by Jaccard similarity."""
+        if not (trigrams := get_trigrams(text)):
+            return []
+        self.load()
+        postings, lengths, changes = self.postings, self.lengths, self.changes
+        # Trigrams no title has (typos, mostly) still count against the similarity
+        missing = trigrams - postings.keys()
+        found = sorted(trigrams - missing, key=lambda trigram: len(postings[trigram][1]))
+        query = missing | frozenset(found[:MAX_QUERY_TRIGRAMS])
+        counts = Counter()
+        for trigram in found[:MAX_QUERY_TRIGRAMS]:
+            counts.update(decode(postings[trigram]))
+        for pk, trigrams in changes.items():
+            if shared := len(trigrams & query):
+                counts[pk] = shared
+            else:
+                counts.pop(pk, None)
+
+        size, minimum = len(query), math.ceil(THRESHOLD * len(query))
+        scored = (
+            (shared, shared / (size + length - shared), -pk)
+            for pk, shared in counts.items()
+            if shared >= minimum and (length := len(changes[pk]) if pk in changes else lengths[pk])
+        )
+        return [-pk for _, _, pk in heapq.nlargest(limit, scored)]
+
+    def get_size(self) -> int:
+        """Approximate memory used by the index, in bytes."""
+        size = sys.getsizeof(self.postings) + sys.getsizeof(self.lengths)
+        for trigram, (first, deltas) in self.postings.items():
+            size += sys.getsizeof(trigram) + sys.getsizeof(first) + sys.getsizeof(deltas) + 56
+        return size
+
+
+index = TrigramIndex()
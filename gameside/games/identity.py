@@ -0,0 +1,10 @@
+from categories.models import Category
+from platforms.models import Platform
+from shared.identity import register
+
+from .models import Game
+
+# Slug -> pk of the small, hot tables views and filters resolve on every request
+games = register(Game)
+categories = register(Category)
+platforms = register(Platform)
@@ -0,0 +1,55 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from factories.data import GAME_NAMES
+from games.fuzzy import TrigramIndex
+
+QUERIES = ('zelad', 'pokemon sapire', 'supr maro', 'finl fantasy', 'metriod prime', 'halo')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the trigram fuzzy search index against size and p99 targets'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--target-p99', type=float, default=5.0, help='milliseconds')
+        parser.add_argument('--target-size', type=float, default=5.0, help='megabytes')
+
+    def handle(self, *args, **options):
+        # Synthetic titles of 2-4 words from the factory vocabulary
+        rng = random.Random(0)
+        words = sorted(set(' '.join(GAME_NAMES).split()))
+        index = TrigramIndex()
+        start = time.perf_counter()
+        index.build(
+            (pk, ' '.join(rng.choices(words, k=rng.randint(2, 4))))
+            for pk in range(1, options['games'] + 1)
+        )
+        elapsed = time.perf_counter() - start
+        size = index.get_size() / 1_000_000
+        self.stdout.write(
+            f'Indexed {options["games"]} titles in {elapsed:.1f} s: '
+            f'{len(index.postings)} trigrams, {size:.1f} MB'
+        )
+
+        timings = []
+        for _ in range(options['repeat']):
+            for query in QUERIES:
+                start = time.perf_counter()
+                index.search(query, options['limit'])
+                timings.append(time.perf_counter() - start)
+        p50 = statistics.median(timings) * 1000
+        p99 = statistics.quantiles(timings, n=100)[98] * 1000
+        self.stdout.write(f'  {len(timings)} searches  p50 {p50:.2f} ms  p99 {p99:.2f} ms')
+
+        if size > options['target_size']:
+            raise CommandError(f'{size:.1f} MB is over the {options["target_size"]} MB target')
+        if p99 > options['target_p99']:
+            raise CommandError(f'p99 {p99:.2f} ms is over the {options["target_p99"]} ms target')
+        self.stdout.write('  Within the size and p99 targets')
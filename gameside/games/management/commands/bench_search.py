@@ -0,0 +1,62 @@
+import random
+import sqlite3
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.lorem_ipsum import WORDS
+
+from factories.data import GAME_NAMES
+from games import search
+
+QUERIES = ('zelda', 'pokémon red', 'mario kart', 'metroid prime', 'final fantasy', 'halo', 'ocar')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the FTS5 game search on a synthetic in-memory table'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=50)
+
+    def handle(self, *args, **options):
+        db = sqlite3.connect(':memory:')
+        db.execute(
+            f'CREATE VIRTUAL TABLE {search.SEARCH_TABLE} USING fts5('
+            "title, description, tokenize='unicode61 remove_diacritics 2')"
+        )
+        rng = random.Random(0)
+        start = time.perf_counter()
+        db.executemany(
+            f'INSERT INTO {search.SEARCH_TABLE}(rowid, title, description) VALUES (?, ?, ?)',
+            (
+                (pk, f'{rng.choice(GAME_NAMES)} {pk}', ' '.join(rng.choices(WORDS, k=30)))
+                for pk in range(1, options['games'] + 1)
+            ),
+        )
+        self.stdout.write(
+            f'Indexed {options["games"]} games in {time.perf_counter() - start:.1f} s'
+        )
+
+        sql = (
+            f'SELECT rowid FROM {search.SEARCH_TABLE} WHERE {search.SEARCH_TABLE} MATCH ? '
+            f'ORDER BY {search.RANK} LIMIT ?'
+        )
+        for text in QUERIES:
+            query = search.to_match_query(text)
+            count_sql = (
+                f'SELECT count(*) FROM {search.SEARCH_TABLE} WHERE {search.SEARCH_TABLE} MATCH ?'
+            )
+            matches = db.execute(count_sql, (query,)).fetchone()[0]
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                db.execute(sql, (query, options['limit'])).fetchall()
+                timings.append(time.perf_counter() - start)
+            p50 = statistics.median(timings) * 1000
+            p99 = statistics.quantiles(timings, n=100)[98] * 1000
+            self.stdout.write(
+                f'  {text!r:<18} {matches:>7} matches  p50 {p50:7.2f} ms  p99 {p99:7.2f} ms'
+            )
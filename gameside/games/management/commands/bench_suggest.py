@@ -0,0 +1,50 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from factories.data import GAME_NAMES
+from games.suggest import PrefixIndex
+
+QUERIES = ('pokémon', 'The Legend of Zelda', 'Super Mario', 'final fantasy', 'Metroid', 'halo')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark title suggestions: one lookup per keystroke against a p99 target'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--target-p99', type=float, default=1.0, help='milliseconds')
+
+    def handle(self, *args, **options):
+        # Synthetic titles, indexed without touching the database
+        rng = random.Random(0)
+        index = PrefixIndex()
+        start = time.perf_counter()
+        index.build(
+            (pk, f'{rng.choice(GAME_NAMES)} {pk}', f'game-{pk}')
+            for pk in range(1, options['games'] + 1)
+        )
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'Indexed {options["games"]} games ({len(index.entries)} keys) in {elapsed:.1f} s'
+        )
+
+        # Every keystroke of every query is a lookup
+        prefixes = [query[:n] for query in QUERIES for n in range(1, len(query) + 1)]
+        timings = []
+        for _ in range(options['repeat']):
+            for prefix in prefixes:
+                start = time.perf_counter()
+                index.suggest(prefix, options['limit'])
+                timings.append(time.perf_counter() - start)
+        p50 = statistics.median(timings) * 1000
+        p99 = statistics.quantiles(timings, n=100)[98] * 1000
+        self.stdout.write(f'  {len(timings)} lookups  p50 {p50:.3f} ms  p99 {p99:.3f} ms')
+        if p99 > options['target_p99']:
+            raise CommandError(f'p99 {p99:.3f} ms is over the {options["target_p99"]} ms target')
+        self.stdout.write(f'  p99 within the {options["target_p99"]} ms target')
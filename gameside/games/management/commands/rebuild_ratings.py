@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Now
+
+from games.models import Game, Review, average_rating
+from shared import fragments
+
+
+class Command(BaseCommand):
+    help = 'Recompute the review count and rating average of every game from its reviews'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        reviews = Review.objects.filter(game=OuterRef('pk')).order_by().values('game')
+        review_count = Coalesce(Subquery(reviews.annotate(count=Count('pk')).values('count')), 0)
+        rating_sum = Coalesce(Subquery(reviews.annotate(sum=Sum('rating')).values('sum')), 0)
+
+        # Only games whose counters drifted are rewritten, each batch in a single UPDATE that
+        # recounts in SQL, so reviews added meanwhile are not lost
+        drifted = (
+            Game.objects.alias(actual_count=review_count, actual_sum=rating_sum)
+            .exclude(review_count=F('actual_count'), rating_sum=F('actual_sum'))
+            .values_list('pk', flat=True)
+        )
+        drifted, size, rebuilt = list(drifted), options['batch_size'], 0
+        for pks in (drifted[i : i + size] for i in range(0, len(drifted), size)):
+            rebuilt += Game.objects.filter(pk__in=pks).update(
+                review_count=review_count,
+                rating_sum=rating_sum,
+                rating_avg=average_rating(rating_sum, review_count),
+                updated_at=Now(),
+            )
+            fragments.invalidate(Game, pks)
+        self.stdout.write(f'Rebuilt the ratings of {rebuilt} games')
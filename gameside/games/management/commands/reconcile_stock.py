@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from games import stock
+
+
+class Command(BaseCommand):
+    help = 'Write the sum of its stock shards to the stock of every sharded game'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        reconciled = stock.reconcile(options['batch_size'])
+        self.stdout.write(f'Reconciled the stock of {reconciled} games')
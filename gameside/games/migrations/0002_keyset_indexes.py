@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-17 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0001_initial'),
+        ('games', '0001_initial'),
+        ('platforms', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['title', 'id'], name='game_title_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['price', 'id'], name='game_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['released_at', 'id'], name='game_released_at_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['game', 'created_at', 'id'], name='review_game_created_id_idx'),
+        ),
+    ]
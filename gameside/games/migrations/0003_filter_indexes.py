@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0001_initial'),
+        ('games', '0002_keyset_indexes'),
+        ('platforms', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['pegi', 'id'], name='game_pegi_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['stock', 'id'], name='game_stock_id_idx'),
+        ),
+    ]
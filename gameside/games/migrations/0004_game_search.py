@@ -0,0 +1,64 @@
+# Generated by Django 6.0 on 2026-10-17 13:00
+
+from django.db import migrations
+
+CREATE_SEARCH_INDEX = [
+    """
+    CREATE VIRTUAL TABLE games_game_fts USING fts5(
+        title, description, content='games_game', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER games_game_fts_insert AFTER INSERT ON games_game BEGIN
+        INSERT INTO games_game_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER games_game_fts_delete AFTER DELETE ON games_game BEGIN
+        INSERT INTO games_game_fts(games_game_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER games_game_fts_update AFTER UPDATE OF title, description ON games_game BEGIN
+        INSERT INTO games_game_fts(games_game_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO games_game_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    "INSERT INTO games_game_fts(games_game_fts) VALUES ('rebuild')",
+]
+
+DROP_SEARCH_INDEX = [
+    'DROP TRIGGER IF EXISTS games_game_fts_insert',
+    'DROP TRIGGER IF EXISTS games_game_fts_delete',
+    'DROP TRIGGER IF EXISTS games_game_fts_update',
+    'DROP TABLE IF EXISTS games_game_fts',
+]
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite only; other backends fall back to LIKE search
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in CREATE_SEARCH_INDEX:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in DROP_SEARCH_INDEX:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0003_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 6.0 on 2026-10-17 15:00
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+
+
+def count_ratings(apps, schema_editor):
+    Game = apps.get_model('games', 'Game')
+    Review = apps.get_model('games', 'Review')
+    reviews = Review.objects.filter(game=OuterRef('pk')).order_by().values('game')
+    review_count = Coalesce(Subquery(reviews.annotate(count=Count('pk')).values('count')), 0)
+    rating_sum = Coalesce(Subquery(reviews.annotate(sum=Sum('rating')).values('sum')), 0)
+    # As games.models.average_rating when this migration was written
+    average = Cast(rating_sum, FloatField()) / NullIf(review_count, 0)
+    Game.objects.update(
+        review_count=review_count,
+        rating_sum=rating_sum,
+        rating_avg=Coalesce(Round(average, 2), Value(0.0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0001_initial'),
+        ('games', '0004_game_search'),
+        ('platforms', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['rating_avg', 'id'], name='game_rating_avg_id_idx'),
+        ),
+        migrations.RunPython(count_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-17 16:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0005_game_rating_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['game', 'rating', 'created_at'], name='review_game_rating_idx'),
+        ),
+    ]
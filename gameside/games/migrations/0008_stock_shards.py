@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-17 17:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0007_game_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='stock_shards',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('stock', models.PositiveIntegerField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='games.game')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('game', 'index'), name='stock_shard_game_index_uniq')],
+            },
+        ),
+    ]
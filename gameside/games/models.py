@@ -1,6 +1,16 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, Now, NullIf, Round
+
+from shared.querycache import CachedQuerySet
+
+
+def average_rating(rating_sum, review_count):
+    # 0 for games without reviews instead of a division by zero
+    average = Cast(rating_sum, FloatField()) / NullIf(review_count, 0)
+    return Coalesce(Round(average, 2), Value(0.0))
 
 
 class Game(models.Model):
@@ -29,6 +39,89 @@ class Game(models.Model):
         null=True,
     )
     platforms = models.ManyToManyField('platforms.Platform', related_name='games')
+    # Denormalized from the reviews table (kept by the review signals, see rebuild_ratings)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField(default=0, editable=False)
+    # How many StockShard rows the stock is split across (0: reserved straight from `stock`, which
+    # otherwise only holds their reconciled sum; see games.stock)
+    stock_shards = models.PositiveSmallIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CachedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['title', 'id'], name='game_title_id_idx'),
+            models.Index(fields=['price', 'id'], name='game_price_id_idx'),
+            models.Index(fields=['released_at', 'id'], name='game_released_at_id_idx'),
+            models.Index(fields=['pegi', 'id'], name='game_pegi_id_idx'),
+            models.Index(fields=['stock', 'id'], name='game_stock_id_idx'),
+            models.Index(fields=['rating_avg', 'id'], name='game_rating_avg_id_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        game = super().from_db(db, field_names, values)
+        # What the title indexes currently hold for this game (see games.suggest)
+        indexed = {'title', 'slug'} <= set(field_names)
+        game._indexed = (game.title, game.slug) if indexed else None
+        return game
+
+    @classmethod
+    def add_ratings(cls, pk: int, count: int, rating: int) -> None:
+        # A single UPDATE relative to the stored values, so concurrent reviews don't overwrite
+        # each other's counts
+        review_count = F('review_count') + count
+        rating_sum = F('rating_sum') + rating
+        cls.objects.filter(pk=pk).update(
+            review_count=review_count,
+            rating_sum=rating_sum,
+            rating_avg=average_rating(rating_sum, review_count),
+            updated_at=Now(),
+        )
+
+    @classmethod
+    def reserve(cls, pk: int) -> bool:
+        """Take one copy of the game out of stock; False when there is none left."""
+        # The check is part of the UPDATE: of concurrent reservations for the last copy only
+        # one still matches the row, without reading it (or locking it) first
+        reserved = cls.objects.filter(pk=pk, stock_shards=0, stock__gt=0).update(
+            stock=F('stock') - 1, updated_at=Now()
+        )
+        return reserved == 1
+
+    @classmethod
+    def release(cls, pks) -> int:
+        """Put one reserved copy of each game back in stock."""
+        games = cls.objects.filter(pk__in=pks, stock_shards=0)
+        return games.update(stock=F('stock') + 1, updated_at=Now())
+
+
+class StockShard(models.Model):
+    """One of the counters a game's stock is split across, so that concurrent reservations of a
+    hot game update different rows."""
+
+    game = models.ForeignKey(Game, related_name='shards', on_delete=models.CASCADE)
+    index = models.PositiveSmallIntegerField()
+    stock = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['game', 'index'], name='stock_shard_game_index_uniq')
+        ]
+
+    @classmethod
+    def take(cls, game_id: int, index: int) -> bool:
+        taken = cls.objects.filter(game_id=game_id, index=index, stock__gt=0).update(
+            stock=F('stock') - 1
+        )
+        return taken == 1
+
+    @classmethod
+    def give(cls, game_ids) -> int:
+        # Releases are rare next to reservations: they all go to the first shard
+        return cls.objects.filter(game_id__in=game_ids, index=0).update(stock=F('stock') + 1)
 
 
 class Review(models.Model):
@@ -40,3 +133,19 @@ class Review(models.Model):
     author = models.ForeignKey(get_user_model(), related_name='reviews', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CachedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['game', 'created_at', 'id'], name='review_game_created_id_idx'),
+            models.Index(fields=['game', 'rating', 'created_at'], name='review_game_rating_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        review = super().from_db(db, field_names, values)
+        # What the game's rating aggregates currently count for this review
+        counted = {'game_id', 'rating'} <= set(field_names)
+        review._counted = (review.game_id, review.rating) if counted else None
+        return review
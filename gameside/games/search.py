@@ -0,0 +1,91 @@
+import re
+
+from django.db import connection
+from django.db.models import Case, Q, QuerySet, When
+from django.db.models.expressions import RawSQL
+
+# FTS5 external-content table over games_game(title, description), kept in sync by triggers
+SEARCH_TABLE = 'games_game_fts'
+# bm25() column weights: a title hit counts ten times a description hit
+RANK = f'bm25({SEARCH_TABLE}, 10.0, 1.0)'
+
+TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert AFTER INSERT ON games_game BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON games_game BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update
+    AFTER UPDATE OF title, description ON games_game BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {SEARCH_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+)
+
+TOKEN = re.compile(r'\w+')
+
+
+def is_supported() -> bool:
+    return connection.vendor == 'sqlite'
+
+
+def to_match_query(text: str) -> str:
+    # Every word must match, as a prefix ("zeld" finds "Zelda"); quoting disables FTS syntax
+    return ' '.join(f'"{token}"*' for token in TOKEN.findall(text))
+
+
+def install_triggers() -> None:
+    # SQLite drops triggers when a migration rebuilds games_game, so they are re-created after
+    # every migrate (no-op when present)
+    if not is_supported() or SEARCH_TABLE not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        for trigger in TRIGGERS:
+            cursor.execute(trigger)
+
+
+def filter_games(queryset: QuerySet, text: str) -> QuerySet:
+    """Games matching `text`, unranked (e.g. for the admin changelist)."""
+    if not (query := to_match_query(text)):
+        return queryset.none()
+    if not is_supported():
+        return queryset.filter(fallback_condition(text))
+    sql = f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s'
+    return queryset.filter(pk__in=RawSQL(sql, [query]))
+
+
+def search_games(queryset: QuerySet, text: str, limit: int) -> QuerySet:
+    """Up to `limit` games matching `text`, best match first."""
+    if not (query := to_match_query(text)):
+        return queryset.none()
+    if not is_supported():
+        return queryset.filter(fallback_condition(text)).order_by('title')[:limit]
+    sql = f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s'
+    with connection.cursor() as cursor:
+        cursor.execute(f'{sql} ORDER BY {RANK} LIMIT %s', [query, limit])
+        ids = [row[0] for row in cursor.fetchall()]
+    return order_by_ids(queryset.filter(pk__in=ids), ids)
+
+
+def order_by_ids(queryset: QuerySet, ids: list[int]) -> QuerySet:
+    if not ids:
+        return queryset.none()
+    return queryset.order_by(Case(*[When(pk=pk, then=rank) for rank, pk in enumerate(ids)]))
+
+
+def fallback_condition(text: str) -> Q:
+    condition = Q()
+    for token in TOKEN.findall(text):
+        condition &= Q(title__icontains=token) | Q(description__icontains=token)
+    return condition
@@ -1,33 +1,35 @@
 from categories.serializers import CategorySerializer
-from shared.serializers import BaseSerializer
+from platforms.serializers import PlatformSerializer
+from shared.serializers import BaseSerializer, Field, FileUrlField, IsoFormatField, NestedField
 from users.serializers import UserSerializer
 
 
 class GameSerializer(BaseSerializer):
-    def serialize_instance(self, instance) -> dict:
-        return {
-            'id': instance.pk,
-            'title': instance.title,
-            'slug': instance.slug,
-            'description': instance.description,
-            'cover': self.build_url(instance.cover.url),
-            'price': instance.price,
-            'stock': instance.stock,
-            'released_at': instance.released_at.isoformat(),
-            'pegi': instance.pegi,
-            'category': CategorySerializer(instance.category).serialize(),
-            'platforms': None,
-        }
+    cache_fragments = True
+
+    id = Field('pk')
+    title = Field()
+    slug = Field()
+    description = Field()
+    cover = FileUrlField()
+    price = Field()
+    stock = Field()
+    released_at = IsoFormatField()
+    pegi = Field()
+    category = NestedField(CategorySerializer)
+    platforms = NestedField(PlatformSerializer, many=True)
+    review_count = Field()
+    rating_avg = Field()
+    updated_at = IsoFormatField()
 
 
 class ReviewSerializer(BaseSerializer):
-    def serialize_instance(self, instance) -> dict:
-        return {
-            'id': instance.pk,
-            'rating': instance.rating,
-            'comment': instance.comment,
-            'game': GameSerializer(instance.game).serialize(),
-            'author': UserSerializer(instance.author).serialize(),
-            'created_at': instance.created_at.isoformat(),
-            'updated_at': instance.updated_at.isoformat(),
-        }
+    cache_fragments = True
+
+    id = Field('pk')
+    rating = Field()
+    comment = Field()
+    game = NestedField(GameSerializer)
+    author = NestedField(UserSerializer)
+    created_at = IsoFormatField()
+    updated_at = IsoFormatField()
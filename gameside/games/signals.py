@@ -0,0 +1,151 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+
+from categories.models import Category
+from platforms.models import Platform
+from shared import fragments
+
+from . import fuzzy, identity, search, stats, suggest
+from .models import Game, Review
+
+User = get_user_model()
+
+# ==============================================================================
+# Serialized fragments
+# ==============================================================================
+
+
+@receiver([post_save, post_delete], sender=Game)
+def invalidate_game_fragments(sender, instance, using, **kwargs):
+    fragments.invalidate_on_commit(Game, [instance.pk], using)
+
+
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_review_fragments(sender, instance, using, **kwargs):
+    fragments.invalidate_on_commit(Review, [instance.pk], using)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_fragments(sender, instance, using, **kwargs):
+    fragments.invalidate_on_commit(User, [instance.pk], using)
+
+
+# Category/platform deletions are handled on pre_delete, while games still reference them
+@receiver([post_save, pre_delete], sender=Category)
+def invalidate_category_games_fragments(sender, instance, using, **kwargs):
+    fragments.invalidate_on_commit(Game, instance.games.values_list('pk', flat=True), using)
+
+
+@receiver([post_save, pre_delete], sender=Platform)
+def invalidate_platform_games_fragments(sender, instance, using, **kwargs):
+    fragments.invalidate_on_commit(Game, instance.games.values_list('pk', flat=True), using)
+
+
+@receiver(m2m_changed, sender=Game.platforms.through)
+def invalidate_game_platforms_fragments(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            fragments.invalidate_on_commit(Game, [instance.pk], using)
+    elif action in ('post_add', 'post_remove'):
+        fragments.invalidate_on_commit(Game, pk_set, using)
+    elif action == 'pre_clear':
+        fragments.invalidate_on_commit(Game, instance.games.values_list('pk', flat=True), using)
+
+
+# ==============================================================================
+# Identity maps
+# ==============================================================================
+
+
+@receiver([post_save, post_delete], sender=Game)
+def invalidate_game_identity(sender, instance, **kwargs):
+    identity.games.invalidate(instance)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_identity(sender, instance, using, **kwargs):
+    fragments.invalidate_on_commit(Category, [instance.pk], using)
+    identity.categories.invalidate(instance)
+
+
+@receiver([post_save, post_delete], sender=Platform)
+def invalidate_platform_identity(sender, instance, using, **kwargs):
+    fragments.invalidate_on_commit(Platform, [instance.pk], using)
+    identity.platforms.invalidate(instance)
+
+
+# ==============================================================================
+# Review stats
+# ==============================================================================
+
+
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_review_stats(sender, instance, **kwargs):
+    game_ids = {instance.game_id}
+    if counted := getattr(instance, '_counted', None):
+        game_ids.add(counted[0])
+    # After commit, so a concurrent request can't cache the stats from before the write
+    transaction.on_commit(lambda: stats.invalidate(game_ids))
+
+
+# ==============================================================================
+# Rating aggregates
+# ==============================================================================
+
+
+@receiver(post_save, sender=Review)
+def count_review_rating(sender, instance, created, using, **kwargs):
+    # Edits are diffed against what was loaded; reviews saved without being loaded first can't
+    # be, and are left to rebuild_ratings
+    counted = getattr(instance, '_counted', None)
+    if not created and counted in (None, (instance.game_id, instance.rating)):
+        return
+    if not created:
+        Game.add_ratings(counted[0], -1, -counted[1])
+        fragments.invalidate_on_commit(Game, [counted[0]], using)
+    Game.add_ratings(instance.game_id, 1, instance.rating)
+    fragments.invalidate_on_commit(Game, [instance.game_id], using)
+    instance._counted = (instance.game_id, instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def discount_review_rating(sender, instance, using, **kwargs):
+    Game.add_ratings(instance.game_id, -1, -instance.rating)
+    fragments.invalidate_on_commit(Game, [instance.game_id], using)
+
+
+# ==============================================================================
+# Search index
+# ==============================================================================
+
+
+@receiver(post_migrate)
+def install_search_triggers(sender, **kwargs):
+    if sender.name == 'games':
+        search.install_triggers()
+
+
+# ==============================================================================
+# In-memory title indexes (suggestions and fuzzy search)
+# ==============================================================================
+
+
+@receiver(post_save, sender=Game)
+def index_game_title(sender, instance, created, using, **kwargs):
+    # Other edits (prices, stock, ratings) leave the indexes, and their version, alone
+    indexed = (instance.title, instance.slug)
+    if not created and getattr(instance, '_indexed', None) == indexed:
+        return
+    suggest.index.add(instance.pk, instance.title, instance.slug)
+    fuzzy.index.add(instance.pk, instance.title)
+    suggest.touch_titles_on_commit(using)
+    instance._indexed = indexed
+
+
+@receiver(post_delete, sender=Game)
+def unindex_game_title(sender, instance, using, **kwargs):
+    suggest.index.remove(instance.pk)
+    fuzzy.index.remove(instance.pk)
+    suggest.touch_titles_on_commit(using)
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db.models import Count, Max
+
+from shared import fragments
+
+from .models import Review
+
+STATS_TIMEOUT = getattr(settings, 'REVIEW_STATS_TIMEOUT', 60 * 60)
+RATINGS = range(1, 6)
+
+
+def cache_key(game_id: int) -> str:
+    return f'review-stats:{game_id}'
+
+
+def get_groups(game_id: int):
+    # One grouped aggregate, answered from the (game, rating, created_at) index alone
+    return (
+        Review.objects.filter(game_id=game_id)
+        .order_by()
+        .values_list('rating')
+        .annotate(Count('pk'), Max('created_at'))
+    )
+
+
+def compute(game_id: int) -> dict:
+    histogram, latest = dict.fromkeys(RATINGS, 0), None
+    for rating, count, created_at in get_groups(game_id):
+        histogram[rating] = count
+        latest = max(latest, created_at) if latest else created_at
+    count = sum(histogram.values())
+    mean = sum(rating * n for rating, n in histogram.items()) / count if count else 0
+    return {
+        'count': count,
+        'mean': round(mean, 2),
+        'histogram': {str(rating): n for rating, n in histogram.items()},
+        # As the serializers render created_at
+        'latest': None if latest is None else latest.isoformat(),
+    }
+
+
+def get_review_stats(game_id: int) -> dict:
+    cache = fragments.get_cache()
+    if (stats := cache.get(key := cache_key(game_id))) is None:
+        stats = compute(game_id)
+        cache.set(key, stats, STATS_TIMEOUT)
+    return stats
+
+
+def invalidate(game_ids) -> None:
+    fragments.get_cache().delete_many([cache_key(game_id) for game_id in game_ids])
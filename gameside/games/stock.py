@@ -0,0 +1,117 @@
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Now
+
+from shared import fragments
+from shared.lru import LRUCache
+
+from .models import Game, StockShard
+
+# Opt-in sharded stock for hot games: with `set_shards(pk, n)` the game's stock is split across n
+# StockShard rows and reservations update a random one of them instead of the game row. Game.stock
+# then holds the sum of the shards as of the last `reconcile`.
+STOCK_CACHE_TIMEOUT = getattr(settings, 'STOCK_CACHE_TIMEOUT', 2)
+
+# Game pk -> number of shards, so reservations know which rows to update without reading the game.
+# A stale count never oversells (each kind of UPDATE checks the mode itself), it only costs a retry.
+shard_counts = LRUCache(maxsize=4096, timeout=60)
+
+
+def get_shards(pk: int) -> int:
+    def load():
+        return Game.objects.filter(pk=pk).values_list('stock_shards', flat=True).first() or 0
+
+    return shard_counts.get(pk, load)
+
+
+def take(pk: int, shards: int) -> bool:
+    if not shards:
+        return Game.reserve(pk)
+    # A random shard first, then the others: writers spread over the rows until they run out
+    start = random.randrange(shards)
+    return any(StockShard.take(pk, (start + i) % shards) for i in range(shards))
+
+
+def reserve(pk: int) -> bool:
+    """Take one copy of the game out of stock, sharded or not; False when there is none left."""
+    # Games without a cached count are tried unsharded: the UPDATE goes before any read, so an
+    # SQLite transaction doesn't have to upgrade a read lock (which fails under contention)
+    shards = shard_counts.peek(pk, 0)
+    while not take(pk, shards):
+        # Out of stock, unless the game was (un)sharded since its count was cached
+        shard_counts.discard([pk])
+        previous, shards = shards, get_shards(pk)
+        if shards == previous:
+            return False
+    return True
+
+
+def release(pks) -> None:
+    """Put one reserved copy of each game back, whichever mode it's in."""
+    pks = list(pks)
+    Game.release(pks)
+    StockShard.give(pks)
+
+
+def shard_total():
+    shards = StockShard.objects.filter(game=OuterRef('pk')).order_by().values('game')
+    return Coalesce(Subquery(shards.annotate(total=Sum('stock')).values('total')), 0)
+
+
+def set_shards(pk: int, shards: int) -> None:
+    """Split the game's stock evenly across `shards` counters, or put it back on the game row
+    with 0."""
+    with transaction.atomic():
+        # The game row is written (and locked) first, then its shards, so reservations of both
+        # kinds wait for the move instead of taking copies that are being counted
+        Game.objects.filter(pk=pk).update(updated_at=Now())
+        counters = StockShard.objects.filter(game_id=pk)
+        stocks = list(counters.select_for_update().values_list('stock', flat=True))
+        game = Game.objects.values('stock', 'stock_shards').get(pk=pk)
+        total = sum(stocks) if game['stock_shards'] else game['stock']
+        counters.delete()
+        StockShard.objects.bulk_create(
+            StockShard(game_id=pk, index=i, stock=total // shards + (i < total % shards))
+            for i in range(shards)
+        )
+        Game.objects.filter(pk=pk).update(stock=total, stock_shards=shards)
+    shard_counts.discard([pk])
+    fragments.get_cache().delete(cache_key(pk))
+    fragments.invalidate(Game, [pk])
+
+
+def cache_key(pk: int) -> str:
+    return f'game-stock:{pk}'
+
+
+def get_available(pk: int) -> int:
+    """Copies of the game left: the sum of its shards (cached for a couple of seconds) when
+    sharded, Game.stock otherwise."""
+    if not get_shards(pk):
+        return Game.objects.filter(pk=pk).values_list('stock', flat=True).first() or 0
+    cache = fragments.get_cache()
+    if (available := cache.get(cache_key(pk))) is None:
+        total = StockShard.objects.filter(game_id=pk).aggregate(total=Sum('stock'))['total']
+        available = total or 0
+        cache.set(cache_key(pk), available, STOCK_CACHE_TIMEOUT)
+    return available
+
+
+def reconcile(batch_size: int = 500) -> int:
+    """Write the sum of their shards to the stock of sharded games that drifted from it."""
+    drifted = (
+        Game.objects.filter(stock_shards__gt=0)
+        .alias(total=shard_total())
+        .exclude(stock=F('total'))
+        .values_list('pk', flat=True)
+    )
+    drifted, reconciled = list(drifted), 0
+    for pks in (drifted[i : i + batch_size] for i in range(0, len(drifted), batch_size)):
+        # Summed again in the UPDATE, so reservations made meanwhile are counted
+        games = Game.objects.filter(pk__in=pks, stock_shards__gt=0)
+        reconciled += games.update(stock=shard_total(), updated_at=Now())
+        fragments.invalidate(Game, pks)
+    return reconciled
@@ -0,0 +1,167 @@
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Iterable
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from shared import fragments
+
+from .models import Game
+
+WORD = re.compile(r'\w+')
+# Seconds an in-memory index is used before checking whether the titles changed since it was
+# built: signals only patch it with the writes of its own process
+TITLE_INDEX_TIMEOUT = getattr(settings, 'TITLE_INDEX_TIMEOUT', 30)
+# Time (ns) a game was last created, deleted or retitled, in the fragment cache: unlike the games
+# table version, reviews, stock and category/platform edits don't move it. Writes that skip the
+# Game signals (bulk or raw SQL) must call touch_titles themselves.
+TITLES_VERSION_KEY = 'title-version:games.game'
+
+
+def fold(text: str) -> str:
+    """Lowercase, strip accents and punctuation: 'Pokémon: Red!' -> 'pokemon red'."""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(WORD.findall(text.casefold()))
+
+
+def get_keys(title: str, slug: str) -> set[str]:
+    # Every word start of the title is a key, so "red" also suggests "Pokémon Red"
+    words = fold(title).split()
+    return {' '.join(words[i:]) for i in range(len(words))} | {fold(slug)}
+
+
+def touch_titles() -> None:
+    fragments.get_cache().set(TITLES_VERSION_KEY, time.time_ns(), None)
+
+
+def touch_titles_on_commit(using: str) -> None:
+    # Bumped now, and again on commit: until then other processes can still rebuild from the
+    # old rows
+    touch_titles()
+    if connections[using].in_atomic_block:
+        transaction.on_commit(touch_titles, using=using)
+
+
+def get_titles_version() -> int:
+    cache = fragments.get_cache()
+    if (version := cache.get(TITLES_VERSION_KEY)) is None:
+        # Evicted (or never set): restarts at "now", which costs each process one rebuild
+        cache.add(TITLES_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(TITLES_VERSION_KEY)
+    return version
+
+
+class TitleIndex:
+    """Process-local index of the games built from the `fields` of their rows.
+
+    Loaded on first use and rebuilt, at most every TITLE_INDEX_TIMEOUT seconds, once the titles
+    version moves (other processes' writes included). While one reader rebuilds it, the
+    others keep using the previous one.
+    """
+
+    fields: tuple[str, ...]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.loaded, self.version, self.checked_at = False, None, 0.0
+
+    def load(self) -> None:
+        if self.loaded and time.monotonic() < self.checked_at + TITLE_INDEX_TIMEOUT:
+            return
+        if not self.lock.acquire(blocking=not self.loaded):
+            return
+        try:
+            if not self.loaded or time.monotonic() >= self.checked_at + TITLE_INDEX_TIMEOUT:
+                self.checked_at = time.monotonic()
+                # Read before the rows, so writes made during the build trigger another one
+                version = get_titles_version()
+                # An index built from given rows is kept until the titles next change
+                if not self.loaded or self.version not in (None, version):
+                    self.build(Game.objects.values_list(*self.fields).iterator())
+                self.version = version
+        finally:
+            self.lock.release()
+
+    def build(self, rows: Iterable[tuple]) -> None:
+        raise NotImplementedError
+
+
+class PrefixIndex(TitleIndex):
+    """Sorted list of (folded key, pk), answered by binary search.
+
+    Patched by Game save/delete signals between builds. Writers replace (never mutate) the list
+    and dict readers use, so suggestions don't lock: a reader iterating by index could otherwise
+    skip entries, or run past the end, as entries are inserted and deleted under it.
+    """
+
+    fields = ('pk', 'title', 'slug')
+
+    def reset(self) -> None:
+        self.entries: list[tuple[str, int]] = []
+        self.games: dict[int, tuple[str, str, set[str]]] = {}
+        super().reset()
+
+    def build(self, rows: Iterable[tuple[int, str, str]]) -> None:
+        games, entries = {}, []
+        for pk, title, slug in rows:
+            keys = get_keys(title, slug)
+            games[pk] = (title, slug, keys)
+            entries.extend((key, pk) for key in keys)
+        entries.sort()
+        self.games, self.entries, self.loaded = games, entries, True
+
+    def add(self, pk: int, title: str, slug: str) -> None:
+        if not self.loaded:
+            return
+        with self.lock:
+            games, entries = self._without(pk)
+            keys = get_keys(title, slug)
+            games[pk] = (title, slug, keys)
+            for key in keys:
+                insort(entries, (key, pk))
+            self.games, self.entries = games, entries
+
+    def remove(self, pk: int) -> None:
+        if not self.loaded:
+            return
+        with self.lock:
+            self.games, self.entries = self._without(pk)
+
+    def _without(self, pk: int) -> tuple[dict, list]:
+        # Copies without the game, for the caller to patch and swap in
+        games, entries = dict(self.games), list(self.entries)
+        if (game := games.pop(pk, None)) is None:
+            return games, entries
+        for key in game[2]:
+            index = bisect_left(entries, (key, pk))
+            if index < len(entries) and entries[index] == (key, pk):
+                del entries[index]
+        return games, entries
+
+    def suggest(self, prefix: str, limit: int) -> list[dict]:
+        if not (prefix := fold(prefix)):
+            return []
+        self.load()
+        entries, games, suggestions, seen = self.entries, self.games, [], set()
+        for index in range(bisect_left(entries, (prefix,)), len(entries)):
+            key, pk = entries[index]
+            if not key.startswith(prefix):
+                break
+            if pk in seen or (game := games.get(pk)) is None:
+                continue
+            seen.add(pk)
+            suggestions.append({'id': pk, 'title': game[0], 'slug': game[1]})
+            if len(suggestions) == limit:
+                break
+        return suggestions
+
+
+index = PrefixIndex()
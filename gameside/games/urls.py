@@ -4,8 +4,11 @@ from . import views
 
 urlpatterns = [
     path('/', views.game_list),
+    path('search', views.game_search),
+    path('suggest', views.game_suggest),
     path('<slug:game_slug>', views.game_detail),
     path('<slug:game_slug>/reviews', views.review_list),
+    path('<slug:game_slug>/reviews/stats', views.review_stats),
     path('<slug:game_slug>/reviews/<int:review_id>', views.review_detail),
     path('<slug:game_slug>/reviews/add', views.add_review),
 ]
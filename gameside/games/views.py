@@ -1,70 +1,177 @@
 import json
-import uuid
 
 from django.contrib.auth import get_user_model
-from django.http import JsonResponse
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_GET, require_POST
 
-from users.models import Token
+from shared import encoders
+from shared.filters import FilterError
+from shared.pagination import CursorPaginator, PaginationError, get_page_size
+from shared.responses import cache_response
+from shared.serializers import FieldsetError, get_fieldsets
+from shared.versions import conditional
+from users import auth
 
+from . import fuzzy, identity, search, stats, suggest
+from .filters import GameFilter
 from .models import Game, Review
 from .serializers import GameSerializer, ReviewSerializer
 
+User = get_user_model()
+
+SUGGEST_LIMIT = 10
+
+# Keyset pagination columns (each backed by a (column, id) index)
+GAME_ORDERINGS = ('pk', 'title', 'price', 'released_at', 'rating_avg')
+REVIEW_ORDERINGS = ('pk', 'created_at')
+
+
+def get_game(request, game_slug: str, **kwargs) -> tuple | None:
+    return (Game, game_id) if (game_id := identity.games.get_pk(game_slug)) else None
+
+
+def is_compact(request) -> bool:
+    # ?compact=1 side-loads nested objects into an "included" block
+    return request.GET.get('compact', '').lower() in ('1', 'true')
+
 
 @require_GET
+@conditional(Game)
+@cache_response(Game)
 def game_list(request):
-    category = request.GET.get('category')
-    platform = request.GET.get('platform')
+    try:
+        games = GameFilter(request.GET).filter(Game.objects.all())
+        paginator = CursorPaginator(request, GAME_ORDERINGS, default_ordering='pk')
+        games = paginator.paginate(games)
+        fields, nested_fields = get_fieldsets(request, GameSerializer)
+    except (FilterError, PaginationError, FieldsetError) as err:
+        return JsonResponse({'error': str(err)}, status=400)
+
+    serializer = GameSerializer(
+        games, fields=fields, nested_fields=nested_fields, request=request, values=True
+    )
+    return paginator.add_headers(serializer.streaming_response())
 
-    games = Game.objects.all()
 
-    if category == None and platform != None:
-        games = Game.objects.filter(platforms__name=platform)
+@require_GET
+def game_search(request):
+    query = request.GET.get('q', '')
+    if not search.to_match_query(query):
+        return JsonResponse({'error': 'Missing search query'}, status=400)
 
-    elif category != None and platform == None:
-        games = Game.objects.filter(category__name=category)
+    try:
+        limit = get_page_size(request)
+        fields, nested_fields = get_fieldsets(request, GameSerializer)
+    except (PaginationError, FieldsetError) as err:
+        return JsonResponse({'error': str(err)}, status=400)
+
+    if request.GET.get('fuzzy', '').lower() in ('1', 'true'):
+        # Typo tolerant: trigram similarity over titles only
+        ids = fuzzy.index.search(query, limit)
+        games = search.order_by_ids(Game.objects.filter(pk__in=ids), ids)
+    else:
+        games = search.search_games(Game.objects.all(), query, limit)
+    serializer = GameSerializer(
+        games, fields=fields, nested_fields=nested_fields, request=request, values=True
+    )
+    return serializer.streaming_response()
 
-    elif category != None and platform != None:
-        games = Game.objects.filter(category__name=category, platforms__name=platform)
 
-    serializer = GameSerializer(games, request=request)
-    return serializer.json_response()
+@require_GET
+def game_suggest(request):
+    prefix = request.GET.get('prefix', '')
+    if not suggest.fold(prefix):
+        return JsonResponse({'error': 'Missing prefix'}, status=400)
+
+    try:
+        limit = get_page_size(request, default=SUGGEST_LIMIT)
+    except PaginationError as err:
+        return JsonResponse({'error': str(err)}, status=400)
+
+    suggestions = suggest.index.suggest(prefix, limit)
+    return HttpResponse(encoders.encode(suggestions), content_type='application/json')
 
 
 @require_GET
+@conditional(Game, get_object=get_game)
+@cache_response(Game, get_object=get_game)
 def game_detail(request, game_slug: str):
-    game = Game.objects.filter(slug=game_slug).first()
+    if not (game_id := identity.games.get_pk(game_slug)):
+        return JsonResponse({'error': 'Game not found'}, status=404)
+
+    try:
+        fields, nested_fields = get_fieldsets(request, GameSerializer)
+    except FieldsetError as err:
+        return JsonResponse({'error': str(err)}, status=400)
+
+    games = Game.objects.filter(pk=game_id)
+    game = GameSerializer.prepare_queryset(games, fields, nested_fields).first()
     if not game:
         return JsonResponse({'error': 'Game not found'}, status=404)
 
-    serializer = GameSerializer(game, request=request)
+    serializer = GameSerializer(game, fields=fields, nested_fields=nested_fields, request=request)
     return serializer.json_response()
 
 
 @require_GET
+@conditional(Review, Game, User)
+@cache_response(Review, Game, User)
 def review_list(request, game_slug: str):
-    game = Game.objects.filter(slug=game_slug).first()
-    if not game:
+    if not (game_id := identity.games.get_pk(game_slug)):
         return JsonResponse({'error': 'Game not found'}, status=404)
 
-    reviews = game.reviews.all()
+    try:
+        paginator = CursorPaginator(request, REVIEW_ORDERINGS, default_ordering='pk')
+        reviews = paginator.paginate(Review.objects.filter(game_id=game_id))
+        fields, nested_fields = get_fieldsets(request, ReviewSerializer)
+    except (PaginationError, FieldsetError) as err:
+        return JsonResponse({'error': str(err)}, status=400)
+
+    serializer = ReviewSerializer(
+        reviews,
+        fields=fields,
+        nested_fields=nested_fields,
+        request=request,
+        values=True,
+        sideload=is_compact(request),
+    )
+    return paginator.add_headers(serializer.streaming_response())
 
-    serializer = ReviewSerializer(reviews, request=request)
-    return serializer.json_response()
+
+@require_GET
+def review_stats(request, game_slug: str):
+    if not (game_id := identity.games.get_pk(game_slug)):
+        return JsonResponse({'error': 'Game not found'}, status=404)
+
+    review_stats = stats.get_review_stats(game_id)
+    return HttpResponse(encoders.encode(review_stats), content_type='application/json')
 
 
 @require_GET
+@conditional(Review, Game, User)
 def review_detail(request, game_slug: str, review_id: int):
-    game = Game.objects.filter(slug=game_slug).first()
-    if not game:
+    if not (game_id := identity.games.get_pk(game_slug)):
         return JsonResponse({'error': 'Game not found'}, status=404)
 
-    review = game.reviews.filter(id=review_id).first()
+    try:
+        fields, nested_fields = get_fieldsets(request, ReviewSerializer)
+    except FieldsetError as err:
+        return JsonResponse({'error': str(err)}, status=400)
+
+    reviews = Review.objects.filter(game_id=game_id, id=review_id)
+    review = ReviewSerializer.prepare_queryset(reviews, fields, nested_fields).first()
     if not review:
         return JsonResponse({'error': 'Review not found'}, status=404)
 
-    serializer = ReviewSerializer(review, request=request)
+    serializer = ReviewSerializer(
+        review,
+        fields=fields,
+        nested_fields=nested_fields,
+        request=request,
+        sideload=is_compact(request),
+    )
     return serializer.json_response()
 
 
@@ -77,11 +184,9 @@ def add_review(request, game_slug: str):
         # Esto es para forzar el KeyError en caso de que no se haya pasado alguno de los campos
         payload['rating']
         payload['comment']
-        payload['game']
-        payload['author']
 
-        # Para forzar el ValueError y así hacer el Invalid authentication token
-        uuid.UUID(str(request.headers['token']))
+        # El autor es el usuario del token (Authorization: Bearer <token>)
+        author = auth.authenticate(request)
 
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON body'}, status=400)
@@ -89,27 +194,27 @@ def add_review(request, game_slug: str):
     except KeyError:
         return JsonResponse({'error': 'Missing required fields'}, status=400)
 
-    except ValueError:
-        return JsonResponse({'error': 'Invalid authentication token'}, status=400)
-
-    if not Token.objects.filter(key=request.headers['token']).first():
-        return JsonResponse({'error': 'Unregistered authentication token'}, status=401)
+    except auth.AuthenticationError as err:
+        return JsonResponse({'error': str(err)}, status=err.status)
 
     if payload['rating'] < 1 or payload['rating'] > 5:
         return JsonResponse({'error': 'Rating is out of range'}, status=400)
 
-    game = Game.objects.filter(slug=game_slug).first()
-
-    if not game or not payload['game']['id'] == game.pk:
+    if not (game_id := identity.games.get_pk(game_slug)):
         return JsonResponse({'error': 'Game not found'}, status=404)
 
-    author = get_user_model().objects.filter(id=payload['author']['id']).first()
-
-    review = Review.objects.create(
-        rating=payload['rating'],
-        comment=payload['comment'],
-        game=game,
-        author=author,
-    )
+    # La reseña y los contadores de valoración del juego se guardan juntos
+    with transaction.atomic():
+        # The map of another process may still hold a game deleted since: the row lock keeps it
+        # from being deleted before the review is saved
+        if not Game.objects.select_for_update().filter(pk=game_id).exists():
+            identity.games.forget([game_id], [game_slug])
+            return JsonResponse({'error': 'Game not found'}, status=404)
+        review = Review.objects.create(
+            rating=payload['rating'],
+            comment=payload['comment'],
+            game_id=game_id,
+            author=author,
+        )
 
     return JsonResponse({'id': review.id})
@@ -91,6 +91,38 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Local memory is per process: deployments running several processes should point these at a
+# shared backend (Redis, Memcached), or each process only sees the invalidations it makes itself.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Serialized fragments and the object and table versions they are keyed by: about one entry
+    # per object per representation, far more than the default 300
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+        'OPTIONS': {'MAX_ENTRIES': 100_000},
+    },
+    # Whole responses and query results, one entry per distinct URL or query
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'OPTIONS': {'MAX_ENTRIES': 10_000},
+    },
+}
+
+FRAGMENT_CACHE = 'fragments'
+RESPONSE_CACHE = 'responses'
+QUERY_CACHE = 'responses'
+# The local memory caches above only stay consistent with a single process (`check --deploy`
+# fails otherwise): unset this once they point at a shared backend
+SINGLE_PROCESS = True
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
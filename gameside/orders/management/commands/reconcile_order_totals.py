@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+
+from orders.models import Order, OrderGame, game_totals
+
+
+class Command(BaseCommand):
+    help = 'Recompute the total and item count of every unpaid order from its items'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        # Items added without signals (raw SQL, bulk_create) are priced as if added now
+        OrderGame.snapshot_prices()
+        # Paid orders keep the totals they were paid with
+        total, item_count = game_totals(OrderGame)
+        unpaid = Order.objects.exclude(status=Order.Status.PAID)
+
+        # Only orders that drifted are rewritten, each batch in a single UPDATE that recounts
+        # in SQL, so games added meanwhile are not lost
+        drifted = (
+            unpaid.alias(actual_total=total, actual_count=item_count)
+            .exclude(total=F('actual_total'), item_count=F('actual_count'))
+            .values_list('pk', flat=True)
+        )
+        drifted, size, reconciled = list(drifted), options['batch_size'], 0
+        for pks in (drifted[i : i + size] for i in range(0, len(drifted), size)):
+            reconciled += unpaid.filter(pk__in=pks).update(
+                total=total, item_count=item_count, updated_at=timezone.now()
+            )
+        self.stdout.write(f'Reconciled the totals of {reconciled} orders')
@@ -0,0 +1,69 @@
+# Generated by Django 6.0 on 2026-10-17 18:00
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+
+
+def count_items(apps, schema_editor):
+    Game = apps.get_model('games', 'Game')
+    Order = apps.get_model('orders', 'Order')
+    OrderGame = apps.get_model('orders', 'OrderGame')
+    # Games already in orders are priced as they are now
+    OrderGame.objects.update(price=Subquery(Game.objects.filter(pk=OuterRef('game')).values('price')))
+    # As orders.models.game_totals when this migration was written
+    items = OrderGame.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    total = Round(Subquery(items.annotate(total=Sum('price')).values('total')), 2)
+    count = Subquery(items.annotate(count=Count('pk')).values('count'))
+    Order.objects.update(total=Coalesce(total, Value(Decimal(0))), item_count=Coalesce(count, 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        # The auto-created through table becomes the OrderGame model, as is
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='OrderGame',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='games.game')),
+                        ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='orders.order')),
+                    ],
+                    options={
+                        'db_table': 'orders_order_games',
+                        'unique_together': {('order', 'game')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='order',
+                    name='games',
+                    field=models.ManyToManyField(blank=True, related_name='orders', through='orders.OrderGame', to='games.game'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ordergame',
+            name='price',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=6, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(count_items, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,24 @@
 import uuid
+from decimal import Decimal
 
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+from django.utils import timezone
+
+from games import stock
+from games.models import Game
+from shared import fragments
+
+
+def game_totals(through):
+    """(total price, count) of the games of each order, as subqueries on the outer order."""
+    items = through.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    # Rounded: SQLite sums decimals as floats
+    total = Round(Subquery(items.annotate(total=Sum('price')).values('total')), 2)
+    count = Subquery(items.annotate(count=Count('pk')).values('count'))
+    return Coalesce(total, Value(Decimal(0))), Coalesce(count, 0)
 
 
 class Order(models.Model):
@@ -16,8 +33,112 @@ class Order(models.Model):
     user = models.ForeignKey(get_user_model(), related_name='orders', on_delete=models.CASCADE)
     games = models.ManyToManyField(
         'games.Game',
+        through='OrderGame',
         blank=True,
         related_name='orders',
     )
+    # Of its games at the prices they were added with, kept by the order games signals (see
+    # reconcile_order_totals) and frozen once the order is paid
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    item_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    # The status an order has to be in to move to each status
+    TRANSITIONS = {
+        Status.CONFIRMED: Status.INITIATED,
+        Status.CANCELLED: Status.INITIATED,
+        Status.PAID: Status.CONFIRMED,
+    }
+
+    def save(self, *args, **kwargs):
+        # Totals are only written by update_totals: the instance may hold stale ones
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('total', 'item_count')
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def transition(cls, pk: int, status: int, **lookups) -> bool:
+        """Move the order to `status` in a single conditional UPDATE, if it's in the status that
+        leads there (and matches `lookups`, e.g. its user).
+
+        False when it isn't, including when a concurrent request moved it first: of two pays, or
+        a pay and a cancel, only one wins.
+        """
+        if status not in cls.TRANSITIONS:
+            raise ValueError('Invalid status')
+        orders = cls.objects.filter(pk=pk, status=cls.TRANSITIONS[status], **lookups)
+        return orders.update(status=status, updated_at=timezone.now()) == 1
+
+    @classmethod
+    def update_totals(cls, pks) -> int:
+        """Recount the totals of the orders that aren't paid, in a single UPDATE."""
+        total, item_count = game_totals(OrderGame)
+        return (
+            cls.objects.filter(pk__in=pks)
+            .exclude(status=cls.Status.PAID)
+            .update(total=total, item_count=item_count, updated_at=timezone.now())
+        )
+
+    def add_game(self, game_id: int) -> bool:
+        """Reserve a copy of the game for the order; False when the game is out of stock.
+
+        Raises ValueError unless the order is initiated, and Game.DoesNotExist when there is no
+        such game.
+        """
+        with transaction.atomic():
+            # Written first, so on SQLite the transaction takes the write lock up front instead
+            # of upgrading a read lock (which fails straight away under contention). The order row
+            # stays locked until the game is added, so a concurrent cancel or confirm either
+            # waits for it (and cancel releases the copy) or wins and no copy is taken.
+            initiated = Order.objects.filter(pk=self.pk, status=self.Status.INITIATED)
+            if not initiated.update(updated_at=timezone.now()):
+                raise ValueError('Orders can only be modified when initiated')
+            reserved = stock.reserve(game_id)
+            if self.games.filter(pk=game_id).exists():
+                # Already reserved for this order
+                transaction.set_rollback(True)
+                return True
+            if not reserved:
+                # Reservations only find out no copy was left, not whether the game exists
+                if not Game.objects.filter(pk=game_id).exists():
+                    raise Game.DoesNotExist(f'Game {game_id} does not exist')
+                return False
+            self.games.add(game_id)
+        transaction.on_commit(lambda: fragments.invalidate(Game, [game_id]))
+        return True
+
+    def cancel(self) -> bool:
+        """Cancel the order if it's still initiated, putting its games back in stock."""
+        with transaction.atomic():
+            # Conditional, so concurrent cancels can't release the same games twice
+            if not Order.transition(self.pk, self.Status.CANCELLED):
+                return False
+            game_ids = list(self.games.values_list('pk', flat=True))
+            stock.release(game_ids)
+        self.status = self.Status.CANCELLED
+        transaction.on_commit(lambda: fragments.invalidate(Game, game_ids))
+        return True
+
+
+class OrderGame(models.Model):
+    order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
+    game = models.ForeignKey('games.Game', related_name='+', on_delete=models.CASCADE)
+    # Of the game when it was added to the order (set by the order games signals)
+    price = models.DecimalField(max_digits=6, decimal_places=2, null=True, editable=False)
+
+    class Meta:
+        # The table of the former auto-created through model
+        db_table = 'orders_order_games'
+        unique_together = [('order', 'game')]
+
+    @classmethod
+    def snapshot_prices(cls, items=None) -> int:
+        """Give the items (all by default) without a price the current price of their game."""
+        items = cls.objects.all() if items is None else items
+        price = Game.objects.filter(pk=OuterRef('game')).values('price')
+        return items.filter(price__isnull=True).update(price=Subquery(price))
@@ -0,0 +1,34 @@
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from .models import Order, OrderGame
+
+# ==============================================================================
+# Order totals
+# ==============================================================================
+
+
+@receiver(m2m_changed, sender=OrderGame)
+def count_order_items(sender, instance, action, reverse, pk_set, **kwargs):
+    # `instance` is the order (order.games), or the game with `reverse` (game.orders)
+    if action == 'pre_clear' and reverse:
+        # Which orders a game was in is gone after the clear
+        instance._cleared_orders = list(instance.orders.values_list('pk', flat=True))
+        return
+    if not action.startswith('post_'):
+        return
+
+    if action == 'post_add':
+        # Prices are snapshotted as games are added
+        if reverse:
+            items = OrderGame.objects.filter(game=instance, order__in=pk_set)
+        else:
+            items = OrderGame.objects.filter(order=instance, game__in=pk_set)
+        OrderGame.snapshot_prices(items)
+
+    if not reverse:
+        Order.update_totals([instance.pk])
+    elif action == 'post_clear':
+        Order.update_totals(instance.__dict__.pop('_cleared_orders', []))
+    else:
+        Order.update_totals(pk_set)
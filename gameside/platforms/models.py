@@ -1,5 +1,7 @@
 from django.db import models
 
+from shared.querycache import CachedQuerySet
+
 
 class Platform(models.Model):
     name = models.CharField(unique=True)
@@ -8,3 +10,5 @@ class Platform(models.Model):
     logo = models.ImageField(
         blank=True, null=True, upload_to='platforms/logos/', default='platforms/logos/default.png'
     )
+
+    objects = CachedQuerySet.as_manager()
@@ -1,12 +1,9 @@
-from shared.serializers import BaseSerializer
+from shared.serializers import BaseSerializer, Field, FileUrlField
 
 
 class PlatformSerializer(BaseSerializer):
-    def serialize_instance(self, instance) -> dict:
-        return {
-            'id': instance.pk,
-            'name': instance.name,
-            'slug': instance.slug,
-            'description': instance.description,
-            'logo': self.build_url(instance.logo.url),
-        }
+    id = Field('pk')
+    name = Field()
+    slug = Field()
+    description = Field()
+    logo = FileUrlField()
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class SharedConfig(AppConfig):
     name = 'shared'
+
+    def ready(self):
+        from . import checks, querycache, versions  # noqa: F401
+
+        querycache.connect_signals()
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from . import fragments
+
+
+@register(Tags.caches, deploy=True)
+def check_versions_cache(app_configs, **kwargs):
+    # Table versions (and the ETags built from them) are only consistent across processes when
+    # the cache holding them is shared
+    backend = settings.CACHES[fragments.FRAGMENT_CACHE]['BACKEND']
+    if backend != 'django.core.cache.backends.locmem.LocMemCache':
+        return []
+    if getattr(settings, 'SINGLE_PROCESS', False):
+        return []
+    return [
+        Error(
+            'The fragment cache uses the local memory backend, so each process keeps its own '
+            'table versions and may answer 304 for data another process changed.',
+            hint=(
+                'Point FRAGMENT_CACHE at a shared backend (Redis, Memcached), or set '
+                'SINGLE_PROCESS = True if the site runs a single process.'
+            ),
+            id='shared.E001',
+        )
+    ]
@@ -0,0 +1,92 @@
+import datetime
+import decimal
+import enum
+import json
+import uuid
+from typing import Callable
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Handlers are looked up by exact type first, then along the MRO (result cached).
+TYPE_HANDLERS: dict[type, Callable[[object], object]] = {}
+_resolved: dict[type, Callable[[object], object] | None] = {}
+_django_default = DjangoJSONEncoder().default
+
+# orjson encodes these itself (subclasses included) without calling `default`, so handlers for
+# them would only apply to the json backend and can't be registered. Dates, times and
+# dataclasses are passed through to `default` by both backends.
+NATIVE_TYPES = (str, int, float, list, tuple, dict, uuid.UUID, enum.Enum)
+
+
+def register(type_: type, handler: Callable[[object], object]) -> None:
+    if issubclass(type_, NATIVE_TYPES):
+        raise TypeError(f'{type_.__qualname__} is encoded natively and cannot be overridden')
+    TYPE_HANDLERS[type_] = handler
+    _resolved.clear()
+
+
+def unregister(type_: type) -> None:
+    TYPE_HANDLERS.pop(type_, None)
+    _resolved.clear()
+
+
+def encode_datetime(value: datetime.datetime) -> str:
+    # Same format as DjangoJSONEncoder (milliseconds, "Z" for UTC)
+    r = value.isoformat()
+    if value.microsecond:
+        r = r[:23] + r[26:]
+    if r.endswith('+00:00'):
+        r = r.removesuffix('+00:00') + 'Z'
+    return r
+
+
+register(decimal.Decimal, str)
+register(datetime.date, datetime.date.isoformat)
+register(datetime.datetime, encode_datetime)
+
+
+def default(value: object) -> object:
+    type_ = type(value)
+    if (handler := TYPE_HANDLERS.get(type_)) is None:
+        if type_ not in _resolved:
+            _resolved[type_] = next(
+                (TYPE_HANDLERS[t] for t in type_.__mro__ if t in TYPE_HANDLERS), None
+            )
+        handler = _resolved[type_] or _django_default
+    return handler(value)
+
+
+_json_encoder = json.JSONEncoder(default=default, ensure_ascii=False, separators=(',', ':'))
+
+
+def encode_json(data: object) -> bytes:
+    return _json_encoder.encode(data).encode()
+
+
+def encode_orjson(data: object) -> bytes:
+    return orjson.dumps(data, default=default, option=ORJSON_OPTIONS)
+
+
+BACKENDS: dict[str, Callable[[object], bytes]] = {'json': encode_json}
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    BACKENDS['orjson'] = encode_orjson
+
+backend = getattr(settings, 'JSON_BACKEND', 'orjson' if orjson is not None else 'json')
+_encode = BACKENDS[backend]
+
+
+def set_backend(name: str) -> None:
+    global backend, _encode
+    _encode = BACKENDS[name]
+    backend = name
+
+
+def encode(data: object) -> bytes:
+    return _encode(data)
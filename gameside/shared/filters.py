@@ -0,0 +1,162 @@
+from typing import Callable
+
+from django.db.models import Field, Model, Q, QuerySet
+from django.http import QueryDict
+
+from . import identity
+
+
+class FilterError(ValueError):
+    pass
+
+
+class Filter:
+    """A query-string parameter compiled into a WHERE condition on `source`."""
+
+    def __init__(self, source: str = ''):
+        self.source = source
+
+    def bind(self, name: str) -> None:
+        self.name = name
+        self.source = self.source or name
+
+    def parse(
+        self, value: str, cast: Callable[[str], object], field: Field | None = None
+    ) -> object:
+        """`value` cast, then converted by the model `field` it's compared with, if any (which
+        rejects what the query couldn't take, e.g. NaN decimals)."""
+        try:
+            value = cast(value)
+            return value if field is None else field.to_python(value)
+        except Exception:
+            raise FilterError(f'Invalid {self.name}')
+
+    def compile(self, model: type[Model], params: QueryDict) -> Q | None:
+        raise NotImplementedError
+
+
+class RelatedFilter(Filter):
+    """Relation matched by slug or, when no slug matches an all-digit value, by id.
+
+    Compiled to a ``pk IN (SELECT ...)`` semi-join rather than a JOIN, so M2M matches never
+    duplicate rows and the database can drive the query from the relation's index. Slugs of
+    models with an identity map are resolved to their id up front, leaving a plain FK
+    comparison (and unknown slugs match nothing without a query).
+    """
+
+    def __init__(self, source: str = '', *, slug_field: str = 'slug'):
+        super().__init__(source)
+        self.slug_field = slug_field
+
+    def compile(self, model, params):
+        if not (value := params.get(self.name)):
+            return None
+        field = model._meta.get_field(self.source)
+        identity_map = identity.get_map(field.related_model)
+        mapped = identity_map is not None and identity_map.field == self.slug_field
+        if mapped:
+            pk = identity_map.get_pk(value)
+        elif value.isdigit():
+            # Slugs can be all digits too, and take precedence over ids
+            related = field.related_model.objects.filter(**{self.slug_field: value})
+            pk = related.values_list('pk', flat=True).first()
+        else:
+            pk = None
+        if pk is None and value.isdigit():
+            # Cleaned, as ids out of the column's range would overflow the query
+            pk_field = field.related_model._meta.pk
+            pk = self.parse(value, lambda value: pk_field.clean(value, None))
+        elif pk is None and mapped:
+            return Q(pk__in=[])
+        if field.many_to_many:
+            target = field.m2m_reverse_field_name()
+            if pk is None:
+                lookup = {f'{target}__{self.slug_field}': value}
+            else:
+                lookup = {f'{target}_id': pk}
+            through = field.remote_field.through.objects.filter(**lookup)
+            return Q(pk__in=through.values(field.m2m_field_name()))
+        if pk is not None:
+            return Q(**{field.attname: pk})
+        related = field.related_model.objects.filter(**{self.slug_field: value})
+        return Q(**{f'{field.attname}__in': related.values('pk')})
+
+
+class InFilter(Filter):
+    """Comma-separated set of values (``?pegi=12,16``)."""
+
+    def __init__(self, source: str = '', *, cast: Callable[[str], object] = int):
+        super().__init__(source)
+        self.cast = cast
+
+    def compile(self, model, params):
+        if not (value := params.get(self.name)):
+            return None
+        values = {self.parse(item, self.cast) for item in value.split(',')}
+        choices = model._meta.get_field(self.source).choices
+        if choices and not values <= {choice for choice, _ in choices}:
+            raise FilterError(f'Invalid {self.name}')
+        return Q(**{f'{self.source}__in': values})
+
+
+class RangeFilter(Filter):
+    """Inclusive range from ``<name>_min`` / ``<name>_max``."""
+
+    def __init__(self, source: str = '', *, cast: Callable[[str], object]):
+        super().__init__(source)
+        self.cast = cast
+
+    def compile(self, model, params):
+        bounds = {}
+        field = model._meta.get_field(self.source)
+        if value := params.get(f'{self.name}_min'):
+            bounds[f'{self.source}__gte'] = self.parse(value, self.cast, field)
+        if value := params.get(f'{self.name}_max'):
+            bounds[f'{self.source}__lte'] = self.parse(value, self.cast, field)
+        return Q(**bounds) if bounds else None
+
+
+class BooleanFilter(Filter):
+    """``?<name>=1`` applies `condition`, ``?<name>=0`` `negated` (or its negation)."""
+
+    def __init__(self, condition: Q, negated: Q | None = None):
+        super().__init__()
+        self.condition = condition
+        self.negated = ~condition if negated is None else negated
+
+    def compile(self, model, params):
+        if not (value := params.get(self.name)):
+            return None
+        if value.lower() in ('1', 'true'):
+            return self.condition
+        if value.lower() in ('0', 'false'):
+            return self.negated
+        raise FilterError(f'Invalid {self.name}')
+
+
+class FilterSet:
+    _declared_filters: dict[str, Filter] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._declared_filters = {}
+        for base in reversed(cls.__mro__):
+            for name, attr in vars(base).items():
+                if isinstance(attr, Filter):
+                    attr.bind(name)
+                    cls._declared_filters[name] = attr
+
+    def __init__(self, params: QueryDict):
+        self.params = params
+
+    def get_conditions(self, model: type[Model]) -> list[Q]:
+        conditions = []
+        for filter_ in self._declared_filters.values():
+            if (condition := filter_.compile(model, self.params)) is not None:
+                conditions.append(condition)
+        return conditions
+
+    def filter(self, queryset: QuerySet) -> QuerySet:
+        if conditions := self.get_conditions(queryset.model):
+            queryset = queryset.filter(*conditions)
+        return queryset
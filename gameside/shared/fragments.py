@@ -0,0 +1,107 @@
+import uuid
+from itertools import islice
+from typing import Callable, Iterator
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Model, QuerySet
+
+from . import encoders
+
+# Fragments are keyed by (serializer, base URL, pk, versions of the object and of the single
+# relations it embeds). Invalidating an object drops its version, so every fragment built from
+# the old one becomes unreachable without scanning keys. Versions live in the same cache, so it
+# has to be shared by every process for one's invalidations to reach the others (see CACHES).
+FRAGMENT_CACHE = getattr(settings, 'FRAGMENT_CACHE', 'default')
+FRAGMENT_TIMEOUT = getattr(settings, 'FRAGMENT_TIMEOUT', 60 * 60)
+
+
+def get_cache():
+    return caches[FRAGMENT_CACHE]
+
+
+def version_key(model: type[Model], pk: object) -> str:
+    return f'fragment-version:{model._meta.label_lower}:{pk}'
+
+
+# Called with (model, pks) after their versions are dropped, by whatever caches versions
+listeners: list[Callable[[type[Model], list], None]] = []
+
+
+def invalidate(model: type[Model], pks) -> None:
+    pks = list(pks)
+    if keys := [version_key(model, pk) for pk in pks]:
+        get_cache().delete_many(keys)
+        for listener in listeners:
+            listener(model, pks)
+
+
+def invalidate_on_commit(model: type[Model], pks, using: str = DEFAULT_DB_ALIAS) -> None:
+    # Invalidated now, and again on commit: other connections can read (and cache) the old rows
+    # until then
+    pks = list(pks)
+    invalidate(model, pks)
+    if connections[using].in_atomic_block:
+        transaction.on_commit(lambda: invalidate(model, pks), using=using)
+
+
+def get_versions(objects: set[tuple[type[Model], object]]) -> dict[tuple, str]:
+    cache = get_cache()
+    keys = {version_key(model, pk): (model, pk) for model, pk in objects}
+    versions = cache.get_many(list(keys))
+    if missing := {key: uuid.uuid4().hex[:12] for key in keys if key not in versions}:
+        cache.set_many(missing, FRAGMENT_TIMEOUT)
+        versions |= missing
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def fragment_keys(serializer, dependencies, rows: list[tuple]) -> list[str]:
+    versions = get_versions(
+        {(model, row[i]) for row in rows for i, (_, model) in enumerate(dependencies)}
+        - {(model, None) for _, model in dependencies}
+    )
+    prefix = f'fragment:{serializer.__class__.__qualname__}:{serializer.build_url("/")}'
+    return [
+        ':'.join(
+            [prefix, str(row[0])]
+            + [versions.get((model, row[i]), '-') for i, (_, model) in enumerate(dependencies)]
+        )
+        for row in rows
+    ]
+
+
+def render_instance(serializer, instance: Model) -> bytes:
+    dependencies = serializer.plan.get_dependencies(type(instance))
+    row = tuple(getattr(instance, attname) for attname, _ in dependencies)
+    key = fragment_keys(serializer, dependencies, [row])[0]
+    cache = get_cache()
+    if (fragment := cache.get(key)) is None:
+        fragment = encoders.encode(serializer.serialize_instance(instance))
+        cache.set(key, fragment, FRAGMENT_TIMEOUT)
+    return fragment
+
+
+def iter_fragments(serializer, queryset: QuerySet, chunk_size: int) -> Iterator[bytes]:
+    # Only the ids are read up front; objects are loaded and serialized on misses
+    model = queryset.model
+    dependencies = serializer.plan.get_dependencies(model)
+    ids = queryset.values_list(*[attname for attname, _ in dependencies])
+    rows = ids.iterator(chunk_size=chunk_size)
+    cache = get_cache()
+    while chunk := list(islice(rows, chunk_size)):
+        keys = fragment_keys(serializer, dependencies, chunk)
+        found = cache.get_many(keys)
+        if missing := {row[0] for row, key in zip(chunk, keys) if key not in found}:
+            misses = serializer.clone(model._default_manager.filter(pk__in=missing))
+            rendered = {pk: encoders.encode(data) for pk, data in misses.iter_keyed(chunk_size)}
+            new = {
+                key: rendered[row[0]]
+                for row, key in zip(chunk, keys)
+                if key not in found and row[0] in rendered
+            }
+            cache.set_many(new, FRAGMENT_TIMEOUT)
+            found |= new
+        for key in keys:
+            if key in found:
+                yield found[key]
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.db.models import Model
+
+from . import fragments
+from .lru import LRUCache
+
+IDENTITY_MAP_SIZE = getattr(settings, 'IDENTITY_MAP_SIZE', 1024)
+IDENTITY_MAP_TIMEOUT = getattr(settings, 'IDENTITY_MAP_TIMEOUT', 60)
+
+
+class IdentityMap:
+    """Process-local LRU map from a unique field (slug) to the object's pk.
+
+    Misses are cached too (as None), so unknown slugs don't reach the database either. Entries
+    expire after `timeout` seconds, which bounds how stale other processes' maps can get; this
+    process drops them as soon as the object's fragment version is invalidated, and its slug
+    (which may be a cached miss) when it's saved.
+    """
+
+    def __init__(
+        self,
+        model: type[Model],
+        field: str = 'slug',
+        *,
+        maxsize: int = IDENTITY_MAP_SIZE,
+        timeout: float = IDENTITY_MAP_TIMEOUT,
+    ):
+        self.model, self.field = model, field
+        self.cache = LRUCache(maxsize, timeout)
+
+    def reset(self) -> None:
+        self.cache.reset()
+
+    def get_pk(self, value: str) -> int | None:
+        return self.cache.get(value, lambda: self.load(value))
+
+    def load(self, value: str) -> int | None:
+        objects = self.model._default_manager.filter(**{self.field: value})
+        if hasattr(objects, 'cached'):
+            # Shared by every process, unlike the map itself
+            objects = objects.cached()
+        return objects.values_list('pk', flat=True).first()
+
+    def forget(self, pks, values=()) -> None:
+        pks = set(pks)
+        self.cache.discard(values, where=lambda pk: pk in pks)
+
+    def invalidate(self, instance: Model) -> None:
+        self.forget([instance.pk], [getattr(instance, self.field)])
+
+
+maps: dict[type[Model], IdentityMap] = {}
+
+
+def register(model: type[Model], field: str = 'slug', **kwargs) -> IdentityMap:
+    maps[model] = IdentityMap(model, field, **kwargs)
+    return maps[model]
+
+
+def get_map(model: type[Model]) -> IdentityMap | None:
+    return maps.get(model)
+
+
+def forget_invalidated(model: type[Model], pks: list) -> None:
+    if identity_map := maps.get(model):
+        identity_map.forget(pks)
+
+
+fragments.listeners.append(forget_invalidated)
@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+class LRUCache:
+    """Process-local, thread-safe map of at most `maxsize` entries that expire after `timeout`
+    seconds, least recently used first out.
+
+    Values are loaded on misses by `get(key, load)`. Any `discard` while a load runs keeps its
+    (possibly stale) value from being stored.
+    """
+
+    def __init__(self, maxsize: int, timeout: float):
+        self.maxsize, self.timeout = maxsize, timeout
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.entries: OrderedDict[Hashable, tuple[object, float]] = OrderedDict()
+            self.generation = 0
+
+    def get(self, key: Hashable, load: Callable[[], object]) -> object:
+        now = time.monotonic()
+        with self.lock:
+            if (entry := self.entries.get(key)) and entry[1] > now:
+                self.entries.move_to_end(key)
+                return entry[0]
+            generation = self.generation
+
+        value = load()
+        with self.lock:
+            if generation == self.generation:
+                self.entries[key] = (value, now + self.timeout)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        return value
+
+    def peek(self, key: Hashable, default: object = None) -> object:
+        """The cached value of `key`, without loading it."""
+        with self.lock:
+            if (entry := self.entries.get(key)) and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                return entry[0]
+        return default
+
+    def discard(self, keys=(), where: Callable[[object], bool] | None = None) -> None:
+        """Drop `keys`, and every entry whose value matches `where`."""
+        with self.lock:
+            self.generation += 1
+            stale = [key for key, (value, _) in self.entries.items() if where and where(value)]
+            for key in [*stale, *keys]:
+                self.entries.pop(key, None)
@@ -0,0 +1,56 @@
+import json
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from categories.models import Category
+from games.models import Game
+from games.serializers import GameSerializer
+from shared import encoders
+
+
+class Command(BaseCommand):
+    help = 'Benchmark JSON encoding of serialized games (stock encoder vs encoder backends)'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        category = Category(pk=1, name='Action', slug='action', color='#ff0000')
+        games = [
+            Game(
+                pk=pk,
+                title=f'Game {pk}',
+                slug=f'game-{pk}',
+                description='Lorem ipsum dolor sit amet, consectetur adipiscing elit.',
+                cover='games/covers/default.png',
+                price=Decimal('59.99'),
+                stock=pk % 100,
+                released_at=date(2024, 1, 1),
+                pegi=Game.PEGI.PEGI12,
+                category=category,
+            )
+            for pk in range(1, options['games'] + 1)
+        ]
+        # Unsaved games cannot resolve the platforms M2M, so it is left out
+        fields = [name for name in GameSerializer._declared_fields if name != 'platforms']
+        data = GameSerializer(games, fields=fields).serialize()
+        candidates = {'DjangoJSONEncoder': lambda d: json.dumps(d, cls=DjangoJSONEncoder).encode()}
+        candidates |= {f'encoders.{name}': func for name, func in encoders.BACKENDS.items()}
+
+        self.stdout.write(f'Encoding {len(data)} games (best of {options["repeat"]}):')
+        baseline = None
+        for name, encode in candidates.items():
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                encode(data)
+                timings.append(time.perf_counter() - start)
+            best = min(timings)
+            baseline = baseline or best
+            self.stdout.write(f'  {name:<20} {best * 1000:8.2f} ms  x{baseline / best:.1f}')
@@ -0,0 +1,104 @@
+import base64
+import json
+from typing import Iterable
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+from django.http import HttpRequest, HttpResponseBase
+
+from . import encoders
+
+PAGE_SIZE = getattr(settings, 'PAGE_SIZE', 50)
+MAX_PAGE_SIZE = getattr(settings, 'MAX_PAGE_SIZE', 100)
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def get_page_size(request: HttpRequest, default: int = PAGE_SIZE) -> int:
+    try:
+        page_size = min(int(request.GET.get('limit', default)), MAX_PAGE_SIZE)
+    except ValueError:
+        raise PaginationError('Invalid page size')
+    if page_size < 1:
+        raise PaginationError('Invalid page size')
+    return page_size
+
+
+class CursorPaginator:
+    """Keyset pagination over (ordering column, pk).
+
+    Pages are selected with ``WHERE (column, pk) > (last column, last pk)`` instead of OFFSET,
+    so every page costs the same. The cursor is an opaque token holding the ordering and the
+    last key of the previous page; the next page is announced in a ``Link: rel="next"`` header.
+    """
+
+    def __init__(self, request: HttpRequest, orderings: Iterable[str], default_ordering: str):
+        self.request = request
+        self.ordering = request.GET.get('ordering', default_ordering)
+        if self.ordering.removeprefix('-') not in orderings:
+            raise PaginationError('Invalid ordering')
+        self.column = self.ordering.removeprefix('-')
+        self.descending = self.ordering.startswith('-')
+        self.page_size = get_page_size(request)
+        self.cursor = self.decode_cursor(request.GET['cursor']) if 'cursor' in request.GET else None
+        self.next_cursor = None
+
+    def decode_cursor(self, cursor: str) -> tuple:
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        except ValueError:
+            raise PaginationError('Invalid cursor')
+        if not isinstance(key, list) or len(key) != 3 or key[0] != self.ordering:
+            raise PaginationError('Invalid cursor')
+        return key[1], key[2]
+
+    def encode_cursor(self, value: object, pk: object) -> str:
+        return (
+            base64.urlsafe_b64encode(encoders.encode([self.ordering, value, pk]))
+            .rstrip(b'=')
+            .decode()
+        )
+
+    def clean_cursor(self, model) -> tuple:
+        """The cursor's values cleaned as those of the ordering column and pk of `model`."""
+        opts = model._meta
+        field = opts.pk if self.column == 'pk' else opts.get_field(self.column)
+        try:
+            # Cleaned rather than just converted: also rejects nulls and integers out of range
+            return field.clean(self.cursor[0], None), opts.pk.clean(self.cursor[1], None)
+        except (ValidationError, TypeError, ValueError) as err:
+            raise PaginationError('Invalid cursor') from err
+
+    def paginate(self, queryset: QuerySet) -> QuerySet:
+        column = self.column
+        lookup = 'lt' if self.descending else 'gt'
+        if self.cursor:
+            value, pk = self.clean_cursor(queryset.model)
+            if column != 'pk':
+                after = Q(**{f'{column}__{lookup}': value}) | Q(
+                    **{column: value, f'pk__{lookup}': pk}
+                )
+            else:
+                after = Q(**{f'pk__{lookup}': pk})
+            queryset = queryset.filter(after)
+        queryset = queryset.order_by(self.ordering, '-pk' if self.descending else 'pk')
+        # Narrow keys-only query to find the last key of the page and whether there is a next one
+        keys = list(queryset.values_list(column, 'pk')[: self.page_size + 1])
+        if len(keys) > self.page_size:
+            self.next_cursor = self.encode_cursor(*keys[self.page_size - 1])
+        return queryset[: self.page_size]
+
+    def get_next_link(self) -> str | None:
+        if self.next_cursor is None:
+            return None
+        query = self.request.GET.copy()
+        query['cursor'] = self.next_cursor
+        return self.request.build_absolute_uri(f'?{query.urlencode()}')
+
+    def add_headers(self, response: HttpResponseBase) -> HttpResponseBase:
+        if next_link := self.get_next_link():
+            response['Link'] = f'<{next_link}>; rel="next"'
+        return response
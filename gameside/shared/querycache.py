@@ -0,0 +1,181 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from functools import cache
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, transaction
+from django.db.models import Model, QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+# Results of opted-in querysets (`.cached()`), keyed by their compiled SQL and params. Each
+# entry records the generation of every table its SQL reads; writes to a table bump that
+# table's generation, so every entry that depends on it stops matching. Only the tables of
+# models managed by a CachedQuerySet (and their many-to-many tables) are tracked: queries that
+# read any other table aren't cached.
+QUERY_CACHE = getattr(settings, 'QUERY_CACHE', 'default')
+QUERY_CACHE_TIMEOUT = getattr(settings, 'QUERY_CACHE_TIMEOUT', 5 * 60)
+
+lock = threading.Lock()
+stats = Counter()
+
+
+def get_cache():
+    return caches[QUERY_CACHE]
+
+
+def generation_key(table: str) -> str:
+    return f'query-table:{table}'
+
+
+def touch(*tables: str) -> None:
+    generation = time.time_ns()
+    get_cache().set_many({generation_key(table): generation for table in tables}, None)
+
+
+def touch_on_commit(using: str, *tables: str) -> None:
+    # Bumped now, and again on commit: other connections can read (and cache) the old rows
+    # until then
+    touch(*tables)
+    if connections[using].in_atomic_block:
+        transaction.on_commit(lambda: touch(*tables), using=using)
+
+
+@cache
+def get_quoted_tables(using: str) -> list[tuple[str, str]]:
+    quote_name = connections[using].ops.quote_name
+    tables = {model._meta.db_table for model in apps.get_models(include_auto_created=True)}
+    return [(table, quote_name(table)) for table in sorted(tables)]
+
+
+def get_tracked_models() -> tuple[list[type[Model]], list[type[Model]]]:
+    """(Models managed by a CachedQuerySet, the through models of their many-to-many fields)."""
+    models = [
+        model
+        for model in apps.get_models()
+        if isinstance(model._default_manager.all(), CachedQuerySet)
+    ]
+    through = {
+        field.remote_field.through for model in models for field in model._meta.local_many_to_many
+    }
+    return models, sorted(through, key=lambda model: model._meta.db_table)
+
+
+@cache
+def get_tracked_tables() -> frozenset[str]:
+    models, through = get_tracked_models()
+    return frozenset(model._meta.db_table for model in [*models, *through])
+
+
+def get_tables(sql: str, using: str) -> list[str]:
+    # Every table the SQL mentions, including joins and subqueries
+    return [table for table, quoted in get_quoted_tables(using) if quoted in sql]
+
+
+def fetch(queryset: QuerySet, timeout: float) -> list:
+    """Rows of `queryset`, from the cache when none of its tables changed since they were read.
+
+    Inside a transaction the cache is bypassed (neither read nor filled), so a transaction
+    always sees its own writes and never publishes rows that may be rolled back.
+    """
+    using = queryset.db
+    if connections[using].in_atomic_block:
+        with lock:
+            stats['bypassed'] += 1
+        return list(queryset._iterable_class(queryset))
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return []
+
+    tables = get_tables(sql, using)
+    if not get_tracked_tables().issuperset(tables):
+        with lock:
+            stats['bypassed'] += 1
+        return list(queryset._iterable_class(queryset))
+    key = ':'.join([using, queryset._iterable_class.__name__, sql, repr(params)])
+    key = f'query:{hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()}'
+    cache = get_cache()
+    found = cache.get_many([key, *map(generation_key, tables)])
+    generations = {table: found.get(generation_key(table)) for table in tables}
+    if (entry := found.get(key)) is not None and entry[1] == generations:
+        with lock:
+            stats['hits'] += 1
+        return entry[0]
+
+    with lock:
+        stats['misses'] += 1
+    # Generations are read before the query, so a write racing with it makes the entry stale
+    if missing := [table for table, generation in generations.items() if generation is None]:
+        touch(*missing)
+        found = cache.get_many([generation_key(table) for table in missing])
+        generations |= {table: found.get(generation_key(table)) for table in missing}
+    rows = list(queryset._iterable_class(queryset))
+    cache.set(key, (rows, generations), timeout)
+    return rows
+
+
+class CachedQuerySet(QuerySet):
+    """QuerySet whose results can be cached with `.cached()`.
+
+    Its bulk writes (update, bulk_create) also bump the table's generation, since they don't
+    send model signals.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cache_timeout = None
+
+    def cached(self, timeout: float = QUERY_CACHE_TIMEOUT):
+        clone = self._chain()
+        clone._cache_timeout = timeout
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._cache_timeout = self._cache_timeout
+        return clone
+
+    def _fetch_all(self):
+        if self._result_cache is None and self._cache_timeout is not None:
+            self._result_cache = fetch(self, self._cache_timeout)
+        super()._fetch_all()
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        touch_on_commit(self.db, self.model._meta.db_table)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        touch_on_commit(self.db, self.model._meta.db_table)
+        return objs
+
+
+def touch_model(sender: type[Model], using: str, **kwargs) -> None:
+    touch_on_commit(using, sender._meta.db_table)
+
+
+def touch_relation(sender: type[Model], action: str, using: str, **kwargs) -> None:
+    if action.startswith('post_'):
+        touch_on_commit(using, sender._meta.db_table)
+
+
+def connect_signals() -> None:
+    """Bump the generations of the tracked tables on model writes (called once apps are ready).
+
+    Connected per model rather than to every sender: writes to other models then skip the cache
+    round trip, and their deletes can still be fast (a collector only fast-deletes models without
+    delete receivers).
+    """
+    models, through = get_tracked_models()
+    # Through rows also go in cascades, which only send post_delete
+    for model in [*models, *through]:
+        post_save.connect(touch_model, sender=model)
+        post_delete.connect(touch_model, sender=model)
+    for model in through:
+        m2m_changed.connect(touch_relation, sender=model)
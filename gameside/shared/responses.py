@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from inspect import iscoroutinefunction
+from typing import Callable
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Model
+from django.http import HttpResponse
+
+from . import versions
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Whole responses are keyed by their ETag, which already hashes the URL with the current
+# generation (table or object version) of everything in the body. Signals move generations on,
+# so old entries become unreachable without scanning keys and simply expire. None disables it.
+RESPONSE_CACHE = getattr(settings, 'RESPONSE_CACHE', 'default')
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 5 * 60)
+# Once fresh entries expire they are still served for this long while one worker refreshes them
+RESPONSE_CACHE_STALE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_STALE_TIMEOUT', 60)
+# How long a refresh may take before another worker is allowed to start one
+REFRESH_LEASE = 30
+# How long a miss waits for another process computing the same response before computing it too
+RESPONSE_CACHE_FILL_WAIT = getattr(settings, 'RESPONSE_CACHE_FILL_WAIT', 5)
+FILL_POLL_INTERVAL = 0.05
+
+lock = threading.Lock()
+stats = Counter()
+flights = SingleFlight()
+# Keeps running background refreshes (async views) from being garbage collected
+tasks: set[asyncio.Task] = set()
+
+Result = tuple[int, dict, bytes]
+
+
+class CachedResponse(HttpResponse):
+    """Response rebuilt from a cache entry; `refresh` runs once it has been sent."""
+
+    refresh: Callable[[], None] | None = None
+
+    def close(self):
+        if self.refresh:
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('Refreshing a stale cached response failed')
+        super().close()
+
+
+def get_cache():
+    return caches[RESPONSE_CACHE]
+
+
+def count(view_name: str, outcome: str) -> None:
+    with lock:
+        stats[view_name, outcome] += 1
+
+
+def get_stats() -> dict[str, dict[str, int]]:
+    """Hits, stale hits, misses and coalesced misses of this process, per view and in total."""
+    outcomes = ('hits', 'stale', 'misses', 'coalesced')
+    with lock:
+        counts = dict(stats)
+    result = {'total': dict.fromkeys(outcomes, 0)}
+    for (view_name, outcome), n in sorted(counts.items()):
+        result.setdefault(view_name, dict.fromkeys(outcomes, 0))[outcome] += n
+        result['total'][outcome] += n
+    return result
+
+
+def cacheable(request) -> bool:
+    # Catalog responses don't depend on the user, but authenticated calls are left alone
+    return (
+        RESPONSE_CACHE is not None
+        and request.method == 'GET'
+        and 'Authorization' not in request.headers
+    )
+
+
+def get_key(request, view_name, models, get_object, args, kwargs) -> str | None:
+    if not cacheable(request):
+        return None
+    if not (etag := versions.get_response_etag(request, models, get_object, args, kwargs)):
+        return None
+    tag = etag.strip('"')
+    return f'response:{view_name}:{tag}'
+
+
+def store(cache, key: str, result: Result) -> None:
+    status, headers, content = result
+    if status == 200:
+        entry = (headers, content, time.time() + RESPONSE_CACHE_TIMEOUT)
+        cache.set(key, entry, RESPONSE_CACHE_TIMEOUT + RESPONSE_CACHE_STALE_TIMEOUT)
+
+
+def fill(cache, key: str, compute: Callable[[], Result]) -> tuple[Result, bool]:
+    """The result of a miss, and whether another process computed it.
+
+    Misses of a key are coalesced across processes by a lease: the process holding it computes
+    the response, the others poll for its entry. They compute it themselves if the lease goes
+    without one (only 200s are cached) or after RESPONSE_CACHE_FILL_WAIT seconds.
+    """
+    lease, deadline = f'{key}:fill', time.monotonic() + RESPONSE_CACHE_FILL_WAIT
+    while not cache.add(lease, 1, REFRESH_LEASE):
+        if (entry := cache.get(key)) is not None:
+            return (200, entry[0], entry[1]), True
+        if time.monotonic() >= deadline:
+            return compute(), False
+        time.sleep(FILL_POLL_INTERVAL)
+    try:
+        # Filled by another process between the miss and the lease
+        if (entry := cache.get(key)) is not None:
+            return (200, entry[0], entry[1]), True
+        return compute(), False
+    finally:
+        cache.delete(lease)
+
+
+async def afill(cache, key: str, compute: Callable) -> tuple[Result, bool]:
+    lease, deadline = f'{key}:fill', time.monotonic() + RESPONSE_CACHE_FILL_WAIT
+    while not await cache.aadd(lease, 1, REFRESH_LEASE):
+        if (entry := await cache.aget(key)) is not None:
+            return (200, entry[0], entry[1]), True
+        if time.monotonic() >= deadline:
+            return await compute(), False
+        await asyncio.sleep(FILL_POLL_INTERVAL)
+    try:
+        if (entry := await cache.aget(key)) is not None:
+            return (200, entry[0], entry[1]), True
+        return await compute(), False
+    finally:
+        await cache.adelete(lease)
+
+
+def render(result: Result, outcome: str) -> CachedResponse:
+    status, headers, content = result
+    response = CachedResponse(content, status=status, headers=headers)
+    if status == 200:
+        response['X-Cache'] = outcome
+    return response
+
+
+# Responses are read whole to be cached, whichever kind of view built them and whichever side
+# (sync or async) reads them: under ASGI sync views stream async iterators too
+def to_result(response) -> Result:
+    if response.streaming and response.is_async:
+        return async_to_sync(ato_result)(response)
+    content = b''.join(response.streaming_content) if response.streaming else response.content
+    return response.status_code, dict(response.headers), content
+
+
+async def ato_result(response) -> Result:
+    if response.streaming and not response.is_async:
+        # Sync iterators may query the database as they go
+        return await sync_to_async(to_result)(response)
+    if not response.streaming:
+        return response.status_code, dict(response.headers), response.content
+    content = b''.join([chunk async for chunk in response.streaming_content])
+    return response.status_code, dict(response.headers), content
+
+
+def cache_response(*models: type[Model], get_object: Callable | None = None):
+    """Serve the view's 200 responses from the response cache.
+
+    Takes the same arguments as `versions.conditional`, and the two share the ETag.
+    Concurrent misses on a key are coalesced into one view call, within the process and across
+    processes sharing the cache (see `fill`); expired entries are served
+    (X-Cache: STALE) while a single worker refreshes them in the background. Works for sync
+    views (WSGI threads, or ASGI's thread pool) and async views (on the event loop).
+    """
+
+    def decorator(view):
+        view_name = f'{view.__module__}.{view.__name__}'
+
+        def lookup(entry) -> tuple[CachedResponse, bool]:
+            # The response, and whether it is stale (so a refresh should start)
+            headers, content, fresh_until = entry
+            if time.time() < fresh_until:
+                count(view_name, 'hits')
+                return render((200, headers, content), 'HIT'), False
+            count(view_name, 'stale')
+            return render((200, headers, content), 'STALE'), True
+
+        if iscoroutinefunction(view):
+
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                get_key_async = sync_to_async(get_key)
+                key = await get_key_async(request, view_name, models, get_object, args, kwargs)
+                if not key:
+                    return await view(request, *args, **kwargs)
+                cache = get_cache()
+
+                async def compute():
+                    result = await ato_result(await view(request, *args, **kwargs))
+                    await sync_to_async(store)(cache, key, result)
+                    return result
+
+                async def refresh():
+                    try:
+                        await compute()
+                    except Exception:
+                        logger.exception('Refreshing a stale cached response failed')
+                    finally:
+                        await cache.adelete(f'{key}:refresh')
+
+                if (entry := await cache.aget(key)) is not None:
+                    response, stale = lookup(entry)
+                    if stale and await cache.aadd(f'{key}:refresh', 1, REFRESH_LEASE):
+                        tasks.add(task := asyncio.create_task(refresh()))
+                        task.add_done_callback(tasks.discard)
+                    return response
+
+                (result, filled), shared = await flights.ado(
+                    key, lambda: afill(cache, key, compute)
+                )
+                coalesced = shared or filled
+                count(view_name, 'coalesced' if coalesced else 'misses')
+                return render(result, 'HIT' if coalesced else 'MISS')
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not (key := get_key(request, view_name, models, get_object, args, kwargs)):
+                return view(request, *args, **kwargs)
+            cache = get_cache()
+
+            def compute():
+                result = to_result(view(request, *args, **kwargs))
+                store(cache, key, result)
+                return result
+
+            def refresh():
+                try:
+                    compute()
+                finally:
+                    cache.delete(f'{key}:refresh')
+
+            if (entry := cache.get(key)) is not None:
+                response, stale = lookup(entry)
+                # Refreshed after the stale response has been sent (see CachedResponse.close)
+                if stale and cache.add(f'{key}:refresh', 1, REFRESH_LEASE):
+                    response.refresh = refresh
+                return response
+
+            (result, filled), shared = flights.do(key, lambda: fill(cache, key, compute))
+            coalesced = shared or filled
+            count(view_name, 'coalesced' if coalesced else 'misses')
+            return render(result, 'HIT' if coalesced else 'MISS')
+
+        return wrapper
+
+    return decorator
@@ -1,40 +1,487 @@
-import json
+import re
 from abc import ABC
-from typing import Iterable
+from itertools import islice
+from operator import attrgetter
+from typing import AsyncIterator, Callable, Iterable, Iterator
 
-from django.http import HttpRequest, JsonResponse
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import QuerySet
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+
+from . import encoders, fragments
+
+STREAM_CHUNK_SIZE = 500
+NESTED_FIELDS_PARAM = re.compile(r'^fields\[(\w+)\]$')
+
+
+class FieldsetError(ValueError):
+    pass
+
+
+class Field:
+    """Plain attribute read from the instance (``source`` defaults to the field name).
+
+    ``columns`` are the model columns the field needs, used to push ``.only()`` down into
+    querysets. ``pk`` is always loaded, so it needs no column."""
+
+    def __init__(self, source: str = '', *, columns: Iterable[str] | None = None):
+        self.source = source
+        self.columns = columns
+
+    def bind(self, name: str) -> None:
+        self.name = name
+        self.source = self.source or name
+        if self.columns is None:
+            self.columns = () if self.source == 'pk' else (self.source,)
+        self.columns = tuple(self.columns)
+
+    # Optional transform(serializer, value) applied in both instance and row mode
+    transform = None
+
+    def extractor(self) -> Callable:
+        getter = attrgetter(self.source)
+        if (transform := self.transform) is None:
+            return lambda serializer, instance: getter(instance)
+        return lambda serializer, instance: transform(serializer, getter(instance))
+
+    def row_extractor(self, row_plan: 'RowPlan', plan: 'Plan', model, prefix: str) -> Callable:
+        source = model._meta.pk.name if self.source == 'pk' else self.source
+        index = row_plan.column(prefix + source)
+        if (transform := self.transform) is None:
+            return lambda serializer, row, related: row[index]
+        return lambda serializer, row, related: transform(serializer, row[index])
+
+
+class IsoFormatField(Field):
+    """Date/datetime rendered with ``isoformat()``."""
+
+    def transform(self, serializer, value) -> str | None:
+        return None if value is None else value.isoformat()
+
+
+class FileUrlField(Field):
+    """Absolute URL of a file field (``None`` when empty)."""
+
+    def extractor(self) -> Callable:
+        getter = attrgetter(self.source)
+
+        def extract(serializer, instance):
+            file = getter(instance)
+            return serializer.build_url(file.url) if file else None
+
+        return extract
+
+    def row_extractor(self, row_plan: 'RowPlan', plan: 'Plan', model, prefix: str) -> Callable:
+        index = row_plan.column(prefix + self.source)
+        storage = model._meta.get_field(self.source).storage
+
+        def extract(serializer, row, related):
+            name = row[index]
+            return serializer.build_url(storage.url(name)) if name else None
+
+        return extract
+
+
+class NestedField(Field):
+    """Related object(s) serialized with ``serializer_class``.
+
+    Single relations are joined with ``select_related``; ``many`` relations are fetched with
+    ``prefetch_related``. Relations of the nested serializer are planned transitively."""
+
+    def __init__(
+        self, serializer_class: type['BaseSerializer'], source: str = '', *, many: bool = False
+    ):
+        super().__init__(source, columns=())
+        self.serializer_class = serializer_class
+        self.many = many
+
+    def extractor(self) -> Callable:
+        getter = attrgetter(self.source)
+        name = self.name
+
+        if self.many:
+
+            def extract(serializer, instance):
+                build = serializer.nested(name).serialize_instance
+                return [
+                    serializer.embed(name, related.pk, build, related)
+                    for related in getter(instance).all()
+                ]
+
+            return extract
+
+        def extract(serializer, instance):
+            related = getter(instance)
+            if related is None:
+                return None
+            return serializer.embed(
+                name, related.pk, serializer.nested(name).serialize_instance, related
+            )
+
+        return extract
+
+    def row_extractor(self, row_plan: 'RowPlan', plan: 'Plan', model, prefix: str) -> Callable:
+        relation = model._meta.get_field(self.source)
+        related_model = relation.related_model
+        nested_plan = plan.nested_plans[self.name]
+        name = self.name
+
+        if self.many:
+            # Fetched by RowPlan.fetch_related() with one values query per chunk of rows
+            key = prefix + self.source
+            pk_index = row_plan.column(prefix + model._meta.pk.name)
+            if relation.concrete:
+                link = relation.related_query_name()
+            else:
+                link = relation.field.name
+            child = RowPlan(nested_plan, related_model, link)
+            row_plan.many.append((key, pk_index, link, child))
+            build = child.build
+            child_pk_index = child.pk_index
+
+            def extract(serializer, row, related):
+                rows, child_related = related[key]
+                nested = serializer.nested(name)
+                return [
+                    serializer.embed(name, r[child_pk_index], build, nested, r, child_related)
+                    for r in rows.get(row[pk_index], ())
+                ]
+
+            return extract
+
+        nested_prefix = f'{prefix}{self.source}__'
+        pk_index = row_plan.column(nested_prefix + related_model._meta.pk.name)
+        build = row_plan.compile(nested_plan, related_model, nested_prefix)
+
+        def extract(serializer, row, related):
+            if (pk := row[pk_index]) is None:
+                return None
+            return serializer.embed(name, pk, build, serializer.nested(name), row, related)
+
+        return extract
+
+
+class RowPlan:
+    """Plan compiled against ``values_list()`` rows, so no model instances are built.
+
+    Single relations become joined columns; ``many`` relations are fetched per chunk of rows
+    with one extra values query each, keyed by the ``link`` column back to the parent."""
+
+    def __init__(self, plan: 'Plan', model, link: str = ''):
+        self.model = model
+        self.columns = [link] if link else []
+        self.many = []
+        self.pk_index = self.column(model._meta.pk.name)
+        self.build = self.compile(plan, model, '')
+
+    def column(self, path: str) -> int:
+        if path not in self.columns:
+            self.columns.append(path)
+        return self.columns.index(path)
+
+    def compile(self, plan: 'Plan', model, prefix: str) -> Callable:
+        extractors = tuple(
+            (f.name, f.row_extractor(self, plan, model, prefix)) for f in plan.fields
+        )
+        return lambda serializer, row, related: {
+            name: extract(serializer, row, related) for name, extract in extractors
+        }
+
+    def fetch_related(self, rows: list[tuple]) -> dict:
+        related = {}
+        for key, pk_index, link, child in self.many:
+            pks = {row[pk_index] for row in rows} - {None}
+            queryset = child.model._default_manager.filter(**{f'{link}__in': pks})
+            child_rows = list(queryset.values_list(*child.columns))
+            grouped = {}
+            for child_row in child_rows:
+                grouped.setdefault(child_row[0], []).append(child_row)
+            related[key] = (grouped, child.fetch_related(child_rows))
+        return related
+
+    def iter_keyed(self, serializer, queryset: QuerySet, chunk_size: int) -> Iterator[tuple]:
+        queryset = queryset.prefetch_related(None).values_list(*self.columns)
+        rows = queryset.iterator(chunk_size=chunk_size)
+        pk_index = self.pk_index
+        while chunk := list(islice(rows, chunk_size)):
+            related = self.fetch_related(chunk)
+            for row in chunk:
+                yield row[pk_index], self.build(serializer, row, related)
+
+
+class Plan:
+    def __init__(self, fields: list[Field], nested_fields: dict[str, Iterable[str]]):
+        self.fields = tuple(fields)
+        self.nested_fields = nested_fields
+        self.nested_plans = {
+            field.name: field.serializer_class.get_plan(nested_fields.get(field.name, ()))
+            for field in fields
+            if isinstance(field, NestedField)
+        }
+        self.row_plans = {}
+        self.extractors = tuple((field.name, field.extractor()) for field in fields)
+        columns = [c for field in fields for c in field.columns]
+        select_related = []
+        prefetch_related = []
+        for field in fields:
+            if not isinstance(field, NestedField):
+                continue
+            source = field.source
+            nested = self.nested_plans[field.name]
+            if field.many:
+                prefetch_related.append(source)
+                prefetch_related += [f'{source}__{r}' for r in nested.select_related]
+            else:
+                columns.append(source)
+                columns += [f'{source}__{c}' for c in nested.columns]
+                select_related.append(source)
+                select_related += [f'{source}__{r}' for r in nested.select_related]
+            prefetch_related += [f'{source}__{r}' for r in nested.prefetch_related]
+        self.columns = tuple(dict.fromkeys(columns))
+        self.select_related = tuple(select_related)
+        self.prefetch_related = tuple(prefetch_related)
+
+    def get_dependencies(self, model) -> list[tuple[str, type]]:
+        # (attname, model) of the instance and of every single relation it embeds
+        dependencies = [(model._meta.pk.attname, model)]
+        for field in self.fields:
+            if isinstance(field, NestedField) and not field.many:
+                relation = model._meta.get_field(field.source)
+                dependencies.append((relation.attname, relation.related_model))
+        return dependencies
+
+    def get_row_plan(self, model) -> RowPlan:
+        if (row_plan := self.row_plans.get(model)) is None:
+            row_plan = self.row_plans[model] = RowPlan(self, model)
+        return row_plan
 
 
 class BaseSerializer(ABC):
+    _declared_fields: dict[str, Field] = {}
+    # Cache each object's encoded JSON (see shared.fragments)
+    cache_fragments = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        declared = dict(cls._declared_fields)
+        for name, value in list(vars(cls).items()):
+            if isinstance(value, Field):
+                value.bind(name)
+                declared[name] = value
+        cls._declared_fields = declared
+        cls._plans = {}
+
+    @classmethod
+    def get_plan(
+        cls, fields: Iterable[str] = (), nested_fields: dict[str, Iterable[str]] | None = None
+    ) -> Plan:
+        fields = frozenset(fields)
+        nested_fields = {name: frozenset(nested) for name, nested in (nested_fields or {}).items()}
+        key = (fields, frozenset(nested_fields.items()))
+        if (plan := cls._plans.get(key)) is None:
+            # Checked before caching, so unknown names can't grow the plans either
+            cls.check_fieldsets(fields, nested_fields)
+            selected = [
+                f for name, f in cls._declared_fields.items() if not fields or name in fields
+            ]
+            plan = cls._plans[key] = Plan(selected, nested_fields)
+        return plan
+
+    @classmethod
+    def check_fieldsets(
+        cls, fields: Iterable[str], nested_fields: dict[str, Iterable[str]]
+    ) -> None:
+        """Raise FieldsetError for names that aren't declared fields (of the nested serializer)."""
+        if not set(fields) <= cls._declared_fields.keys():
+            raise FieldsetError('Invalid fields')
+        for name, nested in nested_fields.items():
+            field = cls._declared_fields.get(name)
+            if not isinstance(field, NestedField):
+                raise FieldsetError(f'Invalid fields[{name}]')
+            if not set(nested) <= field.serializer_class._declared_fields.keys():
+                raise FieldsetError(f'Invalid fields[{name}]')
+
+    @classmethod
+    def prepare_queryset(
+        cls,
+        queryset: QuerySet,
+        fields: Iterable[str] = (),
+        nested_fields: dict[str, Iterable[str]] | None = None,
+    ) -> QuerySet:
+        plan = cls.get_plan(fields, nested_fields)
+        if plan.select_related:
+            queryset = queryset.select_related(*plan.select_related)
+        if plan.prefetch_related:
+            queryset = queryset.prefetch_related(*plan.prefetch_related)
+        if fields or plan.nested_fields:
+            queryset = queryset.only(*plan.columns)
+        return queryset
+
     def __init__(
         self,
         to_serialize: object | Iterable[object],
         *,
         fields: Iterable[str] = [],
+        nested_fields: dict[str, Iterable[str]] | None = None,
         request: HttpRequest = None,
+        values: bool = False,
+        sideload: bool = False,
     ):
-        self.to_serialize = to_serialize
-        self.fields = fields
+        self.fields = tuple(fields)
         self.request = request
+        self.sideload = sideload
+        self.plan = self.get_plan(self.fields, nested_fields)
+        self.row_plan = None
+        self._nested = {}
+        # Nested payloads already built in this response, per field and pk
+        self.embedded: dict[str, dict] = {}
+        if isinstance(to_serialize, QuerySet) and to_serialize._result_cache is None:
+            if values:
+                self.row_plan = self.plan.get_row_plan(to_serialize.model)
+            else:
+                to_serialize = self.prepare_queryset(
+                    to_serialize, self.fields, self.plan.nested_fields
+                )
+        self.to_serialize = to_serialize
 
     def build_url(self, path: str) -> str:
         return self.request.build_absolute_uri(path) if self.request else path
 
-    # To be implemented by subclasses
+    def nested(self, name: str) -> 'BaseSerializer':
+        # One nested serializer per field and response
+        if (serializer := self._nested.get(name)) is None:
+            field = self._declared_fields[name]
+            serializer = self._nested[name] = field.serializer_class(
+                None, fields=self.plan.nested_fields.get(name, ()), request=self.request
+            )
+        return serializer
+
+    def clone(self, to_serialize: object | Iterable[object]) -> 'BaseSerializer':
+        return self.__class__(
+            to_serialize,
+            fields=self.fields,
+            nested_fields=self.plan.nested_fields,
+            request=self.request,
+            values=bool(self.row_plan),
+            sideload=self.sideload,
+        )
+
+    def uses_fragments(self) -> bool:
+        return (
+            self.cache_fragments
+            and not self.fields
+            and not self.plan.nested_fields
+            and not self.sideload
+        )
+
+    def embed(self, name: str, pk: object, build: Callable, *args) -> object:
+        # Each distinct related object is serialized once per response. When side-loading,
+        # rows only carry its pk and the payload goes to the "included" block.
+        memo = self.embedded.setdefault(name, {})
+        if pk not in memo:
+            memo[pk] = build(*args)
+        return pk if self.sideload else memo[pk]
+
+    def get_included(self) -> dict[str, list[dict]]:
+        return {name: list(memo.values()) for name, memo in self.embedded.items()}
+
     def serialize_instance(self, instance: object) -> dict:
-        raise NotImplementedError
+        return {name: extract(self, instance) for name, extract in self.plan.extractors}
+
+    def iter_keyed(self, chunk_size: int | None = None) -> Iterator[tuple[object, dict]]:
+        if self.row_plan:
+            yield from self.row_plan.iter_keyed(
+                self, self.to_serialize, chunk_size or STREAM_CHUNK_SIZE
+            )
+            return
+        instances = self.to_serialize
+        if chunk_size and isinstance(instances, QuerySet):
+            instances = instances.iterator(chunk_size=chunk_size)
+        for instance in instances:
+            yield instance.pk, self.serialize_instance(instance)
 
-    def __serialize_instance(self, instance: object) -> dict:
-        serialized = self.serialize_instance(instance)
-        return {f: v for f, v in serialized.items() if not self.fields or f in self.fields}
+    def iter_serialized(self, chunk_size: int | None = None) -> Iterator[dict]:
+        for _, serialized in self.iter_keyed(chunk_size):
+            yield serialized
 
     def serialize(self) -> dict | list[dict]:
         if not isinstance(self.to_serialize, Iterable):
-            return self.__serialize_instance(self.to_serialize)
-        return [self.__serialize_instance(instance) for instance in self.to_serialize]
+            data = self.serialize_instance(self.to_serialize)
+        else:
+            data = list(self.iter_serialized())
+        if self.sideload:
+            return {'data': data, 'included': self.get_included()}
+        return data
 
     def to_json(self) -> str:
-        return json.dumps(self.serialize())
+        return encoders.encode(self.serialize()).decode()
+
+    def json_response(self) -> HttpResponse:
+        if self.uses_fragments():
+            content = b''.join(self.iter_json())
+        else:
+            content = encoders.encode(self.serialize())
+        return HttpResponse(content, content_type='application/json')
+
+    def iter_json(self, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        # Same bytes as json_response(), written one chunk of rows at a time
+        encode = encoders.encode
+        if not isinstance(self.to_serialize, Iterable):
+            if self.sideload:
+                yield encode(self.serialize())
+            elif self.uses_fragments():
+                yield fragments.render_instance(self, self.to_serialize)
+            else:
+                yield encode(self.serialize_instance(self.to_serialize))
+            return
+        if self.uses_fragments() and isinstance(self.to_serialize, QuerySet):
+            encoded = fragments.iter_fragments(self, self.to_serialize, chunk_size)
+        else:
+            encoded = map(encode, self.iter_serialized(chunk_size))
+        separator = b'['
+        chunk = [b'{"data":'] if self.sideload else []
+        for fragment in encoded:
+            chunk.append(separator)
+            chunk.append(fragment)
+            separator = b','
+            if len(chunk) >= 2 * chunk_size:
+                yield b''.join(chunk)
+                chunk.clear()
+        chunk.append(b']' if separator == b',' else b'[]')
+        if self.sideload:
+            chunk += [b',"included":', encode(self.get_included()), b'}']
+        yield b''.join(chunk)
+
+    async def aiter_json(self, chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        # The ORM is sync-only, so every chunk is produced in the sync thread
+        chunks = self.iter_json(chunk_size)
+        next_chunk = sync_to_async(lambda: next(chunks, None))
+        while (chunk := await next_chunk()) is not None:
+            yield chunk
+
+    def streaming_response(self, chunk_size: int = STREAM_CHUNK_SIZE) -> StreamingHttpResponse:
+        if isinstance(self.request, ASGIRequest):
+            content = self.aiter_json(chunk_size)
+        else:
+            content = self.iter_json(chunk_size)
+        return StreamingHttpResponse(content, content_type='application/json')
+
+
+def get_fieldsets(
+    request: HttpRequest, serializer_class: type[BaseSerializer] | None = None
+) -> tuple[list[str], dict[str, list[str]]]:
+    # ?fields=id,title&fields[category]=name,slug (sparse fieldsets), checked against the fields
+    # of `serializer_class` when given
+    def split(value: str) -> list[str]:
+        return [field for field in value.split(',') if field]
 
-    def json_response(self) -> JsonResponse:
-        return JsonResponse(self.serialize(), safe=False)
+    fields = split(request.GET.get('fields', ''))
+    nested_fields = {
+        match[1]: split(value)
+        for param, value in request.GET.items()
+        if (match := NESTED_FIELDS_PARAM.match(param))
+    }
+    if serializer_class is not None:
+        serializer_class.get_plan(fields, nested_fields)
+    return fields, nested_fields
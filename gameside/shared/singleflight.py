@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import weakref
+from typing import Awaitable, Callable
+
+
+class Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key: the first caller runs the function and the
+    others wait for its result (or exception) instead of running it again.
+
+    `do` is for threads (WSGI workers, and sync views under ASGI, which also run in threads);
+    `ado` for coroutines on an event loop. Both return (result, shared).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: dict[str, Call] = {}
+        self.futures: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def do(self, key: str, function: Callable[[], object]) -> tuple[object, bool]:
+        with self.lock:
+            call = self.calls.get(key)
+            if leader := call is None:
+                call = self.calls[key] = Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function()
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def ado(self, key: str, function: Callable[[], Awaitable]) -> tuple[object, bool]:
+        # Futures belong to a loop, so each running loop coalesces its own calls
+        futures = self.futures.setdefault(asyncio.get_running_loop(), {})
+        if (future := futures.get(key)) is not None:
+            return await asyncio.shield(future), True
+
+        future = futures[key] = asyncio.get_running_loop().create_future()
+        # Followers re-raise the leader's exception; this keeps an unawaited one from being logged
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        try:
+            result = await function()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del futures[key]
+        return result, False
@@ -0,0 +1,88 @@
+import hashlib
+import time
+from functools import wraps
+from typing import Callable
+
+from django.db.models import Model
+from django.utils.cache import get_conditional_response, quote_etag
+
+from . import fragments
+
+# A table's version is the time (ns) its serialized rows last changed: any fragment invalidation
+# touches it. Kept in the fragment cache, so processes only agree on it when that cache is shared:
+# with the local memory backend each one only sees its own writes, and may answer 304 for data
+# another process changed, so it is only fit for a single process (see shared.checks). An evicted
+# version restarts at "now", which only costs clients one full response.
+
+
+def version_key(model: type[Model]) -> str:
+    return f'table-version:{model._meta.label_lower}'
+
+
+def touch(model: type[Model], pks=()) -> None:
+    fragments.get_cache().set(version_key(model), time.time_ns(), None)
+
+
+def get_versions(models) -> list[int]:
+    cache = fragments.get_cache()
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Another process may seed it first; if it is evicted again right away, ours stands
+            version = time.time_ns()
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[key] = version
+    return [versions[key] for key in keys]
+
+
+def get_etag(request, versions) -> str:
+    # The full URL is part of the tag: fieldsets, filters and cursors all change the body
+    parts = [request.build_absolute_uri(), *map(str, versions)]
+    return quote_etag(hashlib.md5('|'.join(parts).encode(), usedforsecurity=False).hexdigest())
+
+
+def get_response_etag(request, models, get_object=None, args=(), kwargs=None) -> str | None:
+    """ETag of the response, computed once per request.
+
+    From the versions of the tables the response is built from or, with
+    `get_object(request, *args, **kwargs) -> (model, pk) | None`, from that single object's
+    fragment version. None when the object doesn't exist.
+    """
+    if hasattr(request, '_etag'):
+        return request._etag
+    if not get_object:
+        request._etag = get_etag(request, get_versions(models))
+    elif (key := get_object(request, *args, **(kwargs or {}))) is None:
+        request._etag = None
+    else:
+        request._etag = get_etag(request, fragments.get_versions({key}).values())
+    return request._etag
+
+
+def conditional(*models: type[Model], get_object: Callable | None = None):
+    """Answer If-None-Match with a 304 before the view runs.
+
+    No Last-Modified is sent: at HTTP's one second precision, a write in the same second as the
+    client's copy would still be answered with a 304.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not (etag := get_response_etag(request, models, get_object, args, kwargs)):
+                return view(request, *args, **kwargs)
+            if response := get_conditional_response(request, etag):
+                return response
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                response.headers.setdefault('ETag', etag)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+fragments.listeners.append(touch)
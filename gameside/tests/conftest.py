@@ -1,4 +1,6 @@
+import factory
 import pytest
+from django.core.cache import caches
 
 from factories import (
     CategoryFactory,
@@ -9,6 +11,9 @@ from factories import (
     TokenFactory,
     UserFactory,
 )
+from games import fuzzy, stock, suggest
+from shared import identity, responses
+from users import auth
 
 # ==============================================================================
 # URL Patterns
@@ -48,6 +53,30 @@ def media_tmpdir(settings, tmp_path):
     settings.MEDIA_ROOT = tmp_path / 'media'
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    for cache in caches.all():
+        cache.clear()
+    suggest.index.reset()
+    fuzzy.index.reset()
+    for identity_map in identity.maps.values():
+        identity_map.reset()
+    auth.users.reset()
+    stock.shard_counts.reset()
+
+
+@pytest.fixture
+def no_response_cache(monkeypatch):
+    # For tests that look at the work views do, rather than at cached responses
+    monkeypatch.setattr(responses, 'RESPONSE_CACHE', None)
+
+
+@pytest.fixture(autouse=True)
+def reset_unique_faker():
+    # Each test starts from an empty database, so unique values only need to be unique per test
+    factory.Faker._get_faker().unique.clear()
+
+
 @pytest.fixture
 def user():
     return UserFactory()
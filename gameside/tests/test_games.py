@@ -1,12 +1,31 @@
+import json
 import uuid
 
 import pytest
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-from factories import GameFactory, ReviewFactory
-from games.models import Review
+from factories import CategoryFactory, GameFactory, PlatformFactory, ReviewFactory
+from games import fuzzy, identity, search, stats, suggest, views
+from games.admin import GameAdmin
+from games.filters import GameFilter
+from games.models import Game, Review
+from shared import fragments, responses
+from shared.identity import IdentityMap
+from shared.pagination import CursorPaginator
 from tests import conftest
 
-from .helpers import compare_games, compare_reviews, get_json, get_obj_by_pk, post_json
+from .helpers import (
+    compare_games,
+    compare_reviews,
+    get_json,
+    get_obj_by_pk,
+    post_json,
+)
 
 # ==============================================================================
 # GAMES
@@ -197,3 +216,992 @@ def test_add_review_fails_when_game_not_found(client, user):
     status, response = post_json(client, url, data, user.token.key)
     assert status == 404
     assert response == {'error': 'Game not found'}
+
+
+# ==============================================================================
+# QUERY COUNTS
+# ==============================================================================
+
+
+def count_queries(view, request, *args) -> int:
+    with CaptureQueriesContext(connection) as context:
+        response = view(request, *args)
+        if response.streaming:
+            b''.join(response.streaming_content)
+    assert response.status_code == 200
+    return len(context)
+
+
+@pytest.mark.django_db
+def test_game_list_query_count_is_constant(rf, no_response_cache, platform):
+    GameFactory.create_batch(2, platforms=[platform])
+    queries = count_queries(views.game_list, rf.get('/'))
+    GameFactory.create_batch(6, platforms=[platform])
+    assert count_queries(views.game_list, rf.get('/')) == queries == 4
+    # Warm fragment cache: only the page keys and the ids are read
+    assert count_queries(views.game_list, rf.get('/')) == 2
+
+
+@pytest.mark.django_db
+def test_game_detail_query_count(rf, no_response_cache, game, django_assert_num_queries):
+    game.platforms.add(PlatformFactory())
+    with django_assert_num_queries(3):
+        views.game_detail(rf.get('/'), game.slug)
+    # The slug is resolved from the identity map
+    with django_assert_num_queries(2):
+        views.game_detail(rf.get('/'), game.slug)
+
+
+@pytest.mark.django_db
+def test_review_list_query_count_is_constant(rf, no_response_cache, game, platform):
+    game.platforms.add(platform)
+    ReviewFactory.create_batch(2, game=game)
+    queries = count_queries(views.review_list, rf.get('/'), game.slug)
+    ReviewFactory.create_batch(6, game=game)
+    assert count_queries(views.review_list, rf.get('/'), game.slug) == queries == 5
+    assert count_queries(views.review_list, rf.get('/'), game.slug) == 2
+
+
+@pytest.mark.django_db
+def test_review_detail_query_count(rf, review, django_assert_num_queries):
+    with django_assert_num_queries(3):
+        views.review_detail(rf.get('/'), review.game.slug, review.pk)
+
+
+# ==============================================================================
+# SPARSE FIELDSETS
+# ==============================================================================
+
+
+def get_view_json(view, request, *args):
+    response = view(request, *args)
+    content = b''.join(response.streaming_content) if response.streaming else response.content
+    return response.status_code, json.loads(content)
+
+
+@pytest.mark.django_db
+def test_game_list_with_sparse_fieldsets(rf):
+    GameFactory.create_batch(3)
+    request = rf.get(
+        '/', {'fields': 'id,slug,title,price,cover,category', 'fields[category]': 'name'}
+    )
+    with CaptureQueriesContext(connection) as context:
+        status, response = get_view_json(views.game_list, request)
+    assert status == 200
+    for game in response:
+        assert list(game) == ['id', 'title', 'slug', 'cover', 'price', 'category']
+        assert list(game['category']) == ['name']
+    sql = ' '.join(query['sql'] for query in context.captured_queries)
+    assert '"description"' not in sql
+    assert '"platforms_platform"' not in sql
+
+
+@pytest.mark.django_db
+def test_game_detail_with_sparse_fieldsets(rf, game):
+    request = rf.get('/', {'fields': 'id,title'})
+    with CaptureQueriesContext(connection) as context:
+        status, response = get_view_json(views.game_detail, request, game.slug)
+    assert status == 200
+    assert response == {'id': game.pk, 'title': game.title}
+    assert len(context) == 2
+    assert '"description"' not in context.captured_queries[1]['sql']
+
+
+@pytest.mark.django_db
+def test_review_list_and_detail_with_sparse_fieldsets(rf, review):
+    request = rf.get('/', {'fields': 'id,game', 'fields[game]': 'id,title'})
+    expected = {'id': review.pk, 'game': {'id': review.game.pk, 'title': review.game.title}}
+    assert get_view_json(views.review_list, request, review.game.slug) == (200, [expected])
+    assert get_view_json(views.review_detail, request, review.game.slug, review.pk) == (
+        200,
+        expected,
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    'params, error',
+    [
+        ({'fields': 'id,titel'}, 'Invalid fields'),
+        ({'fields[cover]': 'name'}, 'Invalid fields[cover]'),
+        ({'fields[categori]': 'name'}, 'Invalid fields[categori]'),
+        ({'fields[category]': 'name,colour'}, 'Invalid fields[category]'),
+    ],
+)
+def test_game_list_and_detail_fail_with_unknown_fields(rf, game, params, error):
+    assert get_view_json(views.game_list, rf.get('/', params)) == (400, {'error': error})
+    response = get_view_json(views.game_detail, rf.get('/', params), game.slug)
+    assert response == (400, {'error': error})
+
+
+# ==============================================================================
+# PAGINATION
+# ==============================================================================
+
+
+def walk_pages(view, request, *args) -> tuple[list, list]:
+    pages, sql = [], []
+    while True:
+        with CaptureQueriesContext(connection) as context:
+            response = view(request, *args)
+            content = (
+                b''.join(response.streaming_content) if response.streaming else response.content
+            )
+            pages.append(json.loads(content))
+        sql += [query['sql'] for query in context.captured_queries]
+        if 'Link' not in response:
+            return pages, sql
+        link = response['Link']
+        assert link.endswith('>; rel="next"')
+        request = rf_from_link(link)
+
+
+def rf_from_link(link: str):
+    return RequestFactory().get(link[1 : link.index('>')])
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('ordering', ['pk', 'title', '-price', 'released_at'])
+def test_game_list_keyset_pagination(rf, ordering):
+    games = GameFactory.create_batch(7)
+    pages, sql = walk_pages(views.game_list, rf.get('/', {'ordering': ordering, 'limit': 3}))
+    assert [len(page) for page in pages] == [3, 3, 1]
+    ids = [game['id'] for page in pages for game in page]
+    column = ordering.removeprefix('-')
+    key = (lambda g: (getattr(g, column), g.pk)) if column != 'pk' else (lambda g: g.pk)
+    expected = sorted(games, key=key, reverse=ordering.startswith('-'))
+    assert ids == [game.pk for game in expected]
+    assert not any('OFFSET' in query for query in sql)
+
+
+@pytest.mark.django_db
+def test_game_list_pagination_keeps_filters(rf, platform):
+    GameFactory.create_batch(3)
+    games = GameFactory.create_batch(5, platforms=[platform])
+    pages, _ = walk_pages(views.game_list, rf.get('/', {'platform': platform.slug, 'limit': 2}))
+    assert [game['id'] for page in pages for game in page] == sorted(game.pk for game in games)
+
+
+@pytest.mark.django_db
+def test_game_list_page_size_is_capped(rf, monkeypatch):
+    from shared import pagination
+
+    monkeypatch.setattr(pagination, 'MAX_PAGE_SIZE', 2)
+    GameFactory.create_batch(3)
+    status, response = get_view_json(views.game_list, rf.get('/', {'limit': 1000}))
+    assert status == 200
+    assert len(response) == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    'params, error',
+    [
+        ({'cursor': 'not-a-cursor'}, 'Invalid cursor'),
+        # ["pk", 1, "abc"], ["pk", 1, 99999999999999999999999], ["price", "1.00", "abc"] and
+        # ["title", null, 1]
+        ({'cursor': 'WyJwayIsMSwiYWJjIl0'}, 'Invalid cursor'),
+        ({'cursor': 'WyJwayIsMSw5OTk5OTk5OTk5OTk5OTk5OTk5OTk5OV0'}, 'Invalid cursor'),
+        ({'ordering': 'price', 'cursor': 'WyJwcmljZSIsIjEuMDAiLCJhYmMiXQ'}, 'Invalid cursor'),
+        ({'ordering': 'title', 'cursor': 'WyJ0aXRsZSIsbnVsbCwxXQ'}, 'Invalid cursor'),
+        ({'limit': 'x'}, 'Invalid page size'),
+        ({'limit': 0}, 'Invalid page size'),
+        ({'ordering': 'description'}, 'Invalid ordering'),
+    ],
+)
+def test_game_list_pagination_fails_with_invalid_params(rf, params, error):
+    assert get_view_json(views.game_list, rf.get('/', params)) == (400, {'error': error})
+
+
+@pytest.mark.django_db
+def test_game_list_cursor_is_bound_to_its_ordering(rf):
+    GameFactory.create_batch(3)
+    response = views.game_list(rf.get('/', {'limit': 1}))
+    request = rf_from_link(response['Link'])
+    request.GET = request.GET.copy()
+    request.GET['ordering'] = 'price'
+    assert get_view_json(views.game_list, request) == (400, {'error': 'Invalid cursor'})
+
+
+@pytest.mark.django_db
+def test_review_list_keyset_pagination(rf, game):
+    reviews = ReviewFactory.create_batch(5, game=game)
+    ReviewFactory.create_batch(2)
+    pages, sql = walk_pages(
+        views.review_list, rf.get('/', {'ordering': '-created_at', 'limit': 2}), game.slug
+    )
+    ids = [review['id'] for page in pages for review in page]
+    expected = sorted(
+        Review.objects.filter(pk__in=[r.pk for r in reviews]),
+        key=lambda r: (r.created_at, r.pk),
+        reverse=True,
+    )
+    assert ids == [review.pk for review in expected]
+    assert not any('OFFSET' in query for query in sql)
+
+
+# ==============================================================================
+# FILTERS
+# ==============================================================================
+
+
+def get_game_ids(rf, params) -> list[int]:
+    status, response = get_view_json(views.game_list, rf.get('/', params))
+    assert status == 200
+    return [game['id'] for game in response]
+
+
+@pytest.mark.django_db
+def test_game_list_filters_by_category_and_platform_slug_or_id(rf, category, platform):
+    other_platform = PlatformFactory()
+    games = GameFactory.create_batch(2, category=category, platforms=[platform, other_platform])
+    GameFactory(category=category, platforms=[other_platform])
+    GameFactory(platforms=[platform])
+    expected = sorted(game.pk for game in games)
+    for category_key in (category.slug, category.pk):
+        for platform_key in (platform.slug, platform.pk):
+            params = {'category': category_key, 'platform': platform_key}
+            assert get_game_ids(rf, params) == expected
+
+
+@pytest.mark.django_db
+def test_game_list_filters_match_all_digit_slugs_before_ids(rf, category, platform):
+    numbered = CategoryFactory(slug=str(category.pk))
+    game = GameFactory(category=numbered, platforms=[PlatformFactory(slug=str(platform.pk))])
+    other = GameFactory(category=category, platforms=[platform])
+    assert get_game_ids(rf, {'category': str(category.pk)}) == [game.pk]
+    assert get_game_ids(rf, {'platform': str(platform.pk)}) == [game.pk]
+    # Ids no slug matches still select by id
+    assert get_game_ids(rf, {'category': str(numbered.pk)}) == [game.pk]
+    assert get_game_ids(rf, {'category': category.slug}) == [other.pk]
+
+
+@pytest.mark.django_db
+def test_game_list_filters_by_pegi_price_release_and_stock(rf):
+    match = GameFactory(pegi=12, price='20.00', released_at='2020-06-01', stock=3)
+    GameFactory(pegi=18, price='20.00', released_at='2020-06-01', stock=3)
+    GameFactory(pegi=12, price='60.00', released_at='2020-06-01', stock=3)
+    GameFactory(pegi=12, price='20.00', released_at='2010-06-01', stock=3)
+    sold_out = GameFactory(pegi=12, price='20.00', released_at='2020-06-01', stock=0)
+    params = {
+        'pegi': '7,12',
+        'price_min': '10',
+        'price_max': '50.5',
+        'released_min': '2020-01-01',
+        'released_max': '2020-12-31',
+    }
+    assert get_game_ids(rf, params | {'in_stock': '1'}) == [match.pk]
+    assert get_game_ids(rf, params | {'in_stock': '0'}) == [sold_out.pk]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    'params, error',
+    [
+        ({'pegi': '13'}, 'Invalid pegi'),
+        ({'pegi': 'x'}, 'Invalid pegi'),
+        ({'price_min': 'cheap'}, 'Invalid price'),
+        ({'price_min': 'nan'}, 'Invalid price'),
+        ({'price_max': 'Infinity'}, 'Invalid price'),
+        ({'category': '99999999999999999999999'}, 'Invalid category'),
+        ({'platform': '99999999999999999999999'}, 'Invalid platform'),
+        ({'released_max': '2020-13-01'}, 'Invalid released'),
+        ({'in_stock': 'maybe'}, 'Invalid in_stock'),
+    ],
+)
+def test_game_list_fails_with_invalid_filters(rf, params, error):
+    assert get_view_json(views.game_list, rf.get('/', params)) == (400, {'error': error})
+
+
+@pytest.fixture
+def games_100k():
+    # Bulk insert straight in SQL: 100k games with 2 platforms each
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            WITH RECURSIVE s(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM s WHERE n < 20)
+            INSERT INTO categories_category (id, name, slug, description, color)
+            SELECT n, 'Category ' || n, 'category-' || n, '', '#ffffff' FROM s
+            """
+        )
+        cursor.execute(
+            """
+            WITH RECURSIVE s(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM s WHERE n < 10)
+            INSERT INTO platforms_platform (id, name, slug, description, logo)
+            SELECT n, 'Platform ' || n, 'platform-' || n, '', '' FROM s
+            """
+        )
+        cursor.execute(
+            """
+            WITH RECURSIVE s(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM s WHERE n < 100000)
+            INSERT INTO games_game
+                (id, title, slug, description, cover, price, stock, released_at, pegi, category_id,
+                review_count, rating_sum, rating_avg, stock_shards, updated_at)
+            SELECT n, 'Game ' || n, 'game-' || n, '', '', (n % 9000) / 100.0 + 1, n % 7,
+                date('2015-01-01', '+' || (n % 3650) || ' days'),
+                CASE n % 5 WHEN 0 THEN 3 WHEN 1 THEN 7 WHEN 2 THEN 12 WHEN 3 THEN 16 ELSE 18 END,
+                1 + n % 20, 0, 0, 0, 0, datetime('now')
+            FROM s
+            """
+        )
+        cursor.execute(
+            """
+            WITH RECURSIVE s(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM s WHERE n < 100000)
+            INSERT INTO games_game_platforms (game_id, platform_id)
+            SELECT n, 1 + n % 10 FROM s UNION ALL SELECT n, 1 + (n + 3) % 10 FROM s
+            """
+        )
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != 'sqlite', reason='EXPLAIN output is SQLite specific')
+def test_game_filters_use_indexes(rf, games_100k):
+    # Unfiltered (or ?in_stock=1) pages walk the id order and stop at LIMIT, so they're left out
+    cases = [
+        {'category': 'category-1'},
+        {'category': '1'},
+        {'platform': 'platform-1'},
+        {'platform': '1'},
+        {'pegi': '12,16'},
+        {'price_min': '10', 'price_max': '20'},
+        {'released_min': '2020-01-01', 'released_max': '2020-02-01'},
+        {'in_stock': '0'},
+        {'platform': 'platform-1', 'ordering': 'price'},
+        {'pegi': '18', 'ordering': '-released_at'},
+        {'category': 'category-1', 'platform': 'platform-2', 'price_max': '30'},
+    ]
+    for params in cases:
+        request = rf.get('/', params)
+        games = GameFilter(request.GET).filter(Game.objects.all())
+        plan = CursorPaginator(request, views.GAME_ORDERINGS, 'pk').paginate(games).explain()
+        scans = [line for line in plan.splitlines() if ' SCAN ' in f' {line} ']
+        assert not scans, (params, plan)
+        assert 'CORRELATED' not in plan, (params, plan)
+
+
+# ==============================================================================
+# SEARCH
+# ==============================================================================
+
+
+def search_titles(rf, query: str, **params) -> list[str]:
+    status, response = get_view_json(views.game_search, rf.get('/', {'q': query, **params}))
+    assert status == 200
+    return [game['title'] for game in response]
+
+
+@pytest.mark.django_db
+def test_game_search_ranks_title_matches_first(rf):
+    GameFactory(title='Pong', description='A zelda-like adventure')
+    GameFactory(title='The Legend of Zelda', description='Classic')
+    GameFactory(title='Pac-Man', description='Maze')
+    assert search_titles(rf, 'zelda') == ['The Legend of Zelda', 'Pong']
+
+
+@pytest.mark.django_db
+def test_game_search_folds_accents_and_matches_prefixes(rf):
+    GameFactory(title='Pokémon Red', description='')
+    GameFactory(title='Pokémon Blue', description='')
+    assert search_titles(rf, 'pokemon red') == ['Pokémon Red']
+    assert sorted(search_titles(rf, 'POKÉ')) == ['Pokémon Blue', 'Pokémon Red']
+    assert search_titles(rf, 'red "OR" blue') == []
+
+
+@pytest.mark.django_db
+def test_game_search_index_follows_writes(rf):
+    game = GameFactory(title='Metroid', description='')
+    game.title = 'Super Metroid'
+    game.save()
+    assert search_titles(rf, 'super') == ['Super Metroid']
+    # Bulk updates skip signals (and the fragment cache) but not the index triggers
+    Game.objects.filter(pk=game.pk).update(title='Metroid Prime')
+    assert search_titles(rf, 'super') == []
+    assert search_titles(rf, 'prime', fields='id,title') == ['Metroid Prime']
+    game.delete()
+    assert search_titles(rf, 'metroid') == []
+
+
+@pytest.mark.django_db
+def test_game_search_respects_limit(rf):
+    GameFactory.create_batch(3, description='shared keyword')
+    assert len(search_titles(rf, 'keyword', limit=2)) == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('params', [{}, {'q': ''}, {'q': '?!'}])
+def test_game_search_fails_without_query(rf, params):
+    response = get_view_json(views.game_search, rf.get('/', params))
+    assert response == (400, {'error': 'Missing search query'})
+
+
+@pytest.mark.django_db
+def test_game_admin_search_uses_search_index(rf):
+    from django.contrib import admin
+
+    game = GameFactory(title='Donkey Kong', description='')
+    GameFactory(title='Galaga', description='')
+    model_admin = GameAdmin(Game, admin.site)
+    with CaptureQueriesContext(connection) as context:
+        games, duplicates = model_admin.get_search_results(rf.get('/'), Game.objects.all(), 'kong')
+        assert list(games) == [game]
+    assert not duplicates
+    assert search.SEARCH_TABLE in context.captured_queries[0]['sql']
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != 'sqlite', reason='FTS5 triggers are SQLite specific')
+def test_search_triggers_are_reinstalled(rf):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TRIGGER {search.SEARCH_TABLE}_insert')
+    search.install_triggers()
+    GameFactory(title='Frogger', description='')
+    assert search_titles(rf, 'frogger') == ['Frogger']
+
+
+# ==============================================================================
+# SUGGESTIONS
+# ==============================================================================
+
+
+def suggest_titles(rf, prefix: str, **params) -> list[str]:
+    status, response = get_view_json(views.game_suggest, rf.get('/', {'prefix': prefix, **params}))
+    assert status == 200
+    return [game['title'] for game in response]
+
+
+def test_fold_strips_accents_case_and_punctuation():
+    assert suggest.fold('  Pokémon: Red! ') == 'pokemon red'
+    assert suggest.fold('Pac-Man') == 'pac man'
+
+
+@pytest.mark.django_db
+def test_game_suggest_matches_folded_word_prefixes(rf):
+    for title in ('Pokémon Red', 'Pokémon Blue', 'Pong', 'Red Dead Redemption'):
+        GameFactory(title=title)
+    assert suggest_titles(rf, 'poke') == ['Pokémon Blue', 'Pokémon Red']
+    assert suggest_titles(rf, 'POKÉMON R') == ['Pokémon Red']
+    # Ordered by the matched key: 'red' (from 'Pokémon Red') sorts before 'red dead redemption'
+    assert suggest_titles(rf, 'red') == ['Pokémon Red', 'Red Dead Redemption']
+    assert suggest_titles(rf, 'pokemon-bl') == ['Pokémon Blue']
+    assert suggest_titles(rf, 'po', limit=2) == ['Pokémon Blue', 'Pokémon Red']
+    assert suggest_titles(rf, 'zelda') == []
+
+
+@pytest.mark.django_db
+def test_game_suggest_reads_the_database_once(rf):
+    GameFactory(title='Galaga')
+    with CaptureQueriesContext(connection) as context:
+        assert suggest_titles(rf, 'gal') == ['Galaga']
+        assert suggest_titles(rf, 'gala') == ['Galaga']
+    assert len(context) == 1
+
+
+@pytest.mark.django_db
+def test_game_suggest_follows_game_signals(rf):
+    game = GameFactory(title='Metroid')
+    assert suggest_titles(rf, 'met') == ['Metroid']
+    game.title = 'Super Metroid'
+    game.save()
+    GameFactory(title='Metroid Prime')
+    assert suggest_titles(rf, 'met') == ['Super Metroid', 'Metroid Prime']
+    assert suggest_titles(rf, 'super') == ['Super Metroid']
+    game.delete()
+    assert suggest_titles(rf, 'met') == ['Metroid Prime']
+
+
+@pytest.mark.django_db
+def test_game_suggest_reloads_when_the_titles_change(rf, monkeypatch):
+    game = GameFactory(title='Metroid')
+    assert suggest_titles(rf, 'met') == ['Metroid']
+    # As another process would write it: only the titles version tells
+    Game.objects.filter(pk=game.pk).update(title='Super Metroid')
+    suggest.touch_titles()
+    assert suggest_titles(rf, 'super') == []
+    monkeypatch.setattr(suggest, 'TITLE_INDEX_TIMEOUT', 0)
+    assert suggest_titles(rf, 'super') == ['Super Metroid']
+
+
+@pytest.mark.django_db
+def test_game_suggest_is_not_rebuilt_by_other_game_writes(rf, monkeypatch, game):
+    monkeypatch.setattr(suggest, 'TITLE_INDEX_TIMEOUT', 0)
+    builds = []
+    build = suggest.index.build
+    monkeypatch.setattr(suggest.index, 'build', lambda rows: builds.append(1) or build(rows))
+    assert suggest_titles(rf, game.title) == [game.title]
+    ReviewFactory(game=game)
+    game.refresh_from_db()
+    game.stock += 1
+    game.save()
+    assert suggest_titles(rf, game.title) == [game.title]
+    assert len(builds) == 1
+    game.title = 'Renamed'
+    game.save()
+    assert suggest_titles(rf, 'renamed') == ['Renamed']
+    assert len(builds) == 2
+
+
+def test_prefix_index_writes_leave_readers_lists_alone():
+    index = suggest.PrefixIndex()
+    index.build([(1, 'Metroid', 'metroid'), (2, 'Contra', 'contra')])
+    entries, games = index.entries, index.games
+    read = (list(entries), dict(games))
+    index.add(3, 'Metal Gear', 'metal-gear')
+    index.add(2, 'Super Contra', 'super-contra')
+    index.remove(1)
+    assert (entries, games) == read
+    assert [game['title'] for game in index.suggest('me', 5)] == ['Metal Gear']
+    assert [game['title'] for game in index.suggest('contra', 5)] == ['Super Contra']
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('params', [{}, {'prefix': ''}, {'prefix': ' - '}])
+def test_game_suggest_fails_without_prefix(rf, params):
+    response = get_view_json(views.game_suggest, rf.get('/', params))
+    assert response == (400, {'error': 'Missing prefix'})
+
+
+# ==============================================================================
+# FUZZY SEARCH
+# ==============================================================================
+
+
+def test_trigram_postings_round_trip():
+    pks = [3, 4, 200, 70_000, 70_001]
+    assert list(fuzzy.decode(fuzzy.encode(pks))) == pks
+    assert fuzzy.encode([1, 2, 3])[1].typecode == 'B'
+
+
+@pytest.mark.django_db
+def test_game_search_fuzzy_tolerates_typos(rf):
+    for title in ('The Legend of Zelda', 'Pokémon Sapphire', 'Pokémon Red', 'Super Mario 64'):
+        GameFactory(title=title)
+    assert search_titles(rf, 'zelad', fuzzy=1) == ['The Legend of Zelda']
+    assert search_titles(rf, 'pokemon sapire', fuzzy=1) == ['Pokémon Sapphire', 'Pokémon Red']
+    assert search_titles(rf, 'supr mario', fuzzy='true') == ['Super Mario 64']
+    assert search_titles(rf, 'xyz', fuzzy=1) == []
+
+
+@pytest.mark.django_db
+def test_game_search_fuzzy_follows_game_signals(rf):
+    game = GameFactory(title='Metroid')
+    assert search_titles(rf, 'metriod', fuzzy=1) == ['Metroid']
+    game.title = 'Castlevania'
+    game.save()
+    assert search_titles(rf, 'metriod', fuzzy=1) == []
+    assert search_titles(rf, 'castelvania', fuzzy=1) == ['Castlevania']
+    GameFactory(title='Metroid Prime')
+    assert search_titles(rf, 'metriod', fuzzy=1) == ['Metroid Prime']
+    game.delete()
+    assert search_titles(rf, 'castelvania', fuzzy=1) == []
+
+
+@pytest.mark.django_db
+def test_game_search_fuzzy_reloads_when_the_titles_change(rf, monkeypatch):
+    game = GameFactory(title='Metroid')
+    assert search_titles(rf, 'metriod', fuzzy=1) == ['Metroid']
+    # As another process would write it: only the shared cache tells
+    Game.objects.filter(pk=game.pk).update(title='Castlevania')
+    fragments.invalidate(Game, [game.pk])
+    suggest.touch_titles()
+    assert search_titles(rf, 'castelvania', fuzzy=1) == []
+    monkeypatch.setattr(suggest, 'TITLE_INDEX_TIMEOUT', 0)
+    assert search_titles(rf, 'castelvania', fuzzy=1) == ['Castlevania']
+
+
+@pytest.mark.django_db
+def test_game_search_fuzzy_is_not_rebuilt_by_other_game_writes(rf, monkeypatch, game):
+    monkeypatch.setattr(suggest, 'TITLE_INDEX_TIMEOUT', 0)
+    builds = []
+    build = fuzzy.index.build
+    monkeypatch.setattr(fuzzy.index, 'build', lambda rows: builds.append(1) or build(rows))
+    assert search_titles(rf, game.title, fuzzy=1) == [game.title]
+    ReviewFactory(game=game)
+    assert search_titles(rf, game.title, fuzzy=1) == [game.title]
+    assert len(builds) == 1
+
+
+def test_trigram_index_merges_changes():
+    index = fuzzy.TrigramIndex()
+    index.build([(1, 'Metroid'), (2, 'Castlevania'), (3, 'Contra')])
+    index.add(2, 'Super Metroid')
+    index.remove(3)
+    index.add(70_000, 'Contra III')
+    expected = {query: index.search(query, 5) for query in ('metroid', 'contra', 'castlevania')}
+    assert expected == {'metroid': [1, 2], 'contra': [70_000], 'castlevania': []}
+    index.merge()
+    assert not index.changes
+    assert {query: index.search(query, 5) for query in expected} == expected
+    # One length per game, however large the pks
+    assert index.lengths.keys() == {1, 2, 70_000}
+
+
+# ==============================================================================
+# RATINGS
+# ==============================================================================
+
+
+def get_ratings(game):
+    game.refresh_from_db()
+    return game.review_count, game.rating_sum, game.rating_avg
+
+
+@pytest.mark.django_db
+def test_add_review_updates_game_ratings(rf, user, game):
+    ReviewFactory(game=game, rating=4)
+    data = {'rating': 1, 'comment': 'Meh'}
+    headers = {'Authorization': f'Bearer {user.token.key}'}
+    request = rf.post('/', json.dumps(data), 'application/json', headers=headers)
+    response = views.add_review(request, game.slug)
+    assert response.status_code == 200
+    assert get_ratings(game) == (2, 5, 2.5)
+
+
+@pytest.mark.django_db
+def test_add_review_fails_when_the_game_was_deleted_by_another_process(rf, user, game):
+    slug, pk = game.slug, game.pk
+    game.delete()
+    # Still in the identity map of the process receiving the review
+    identity.games.cache.get(slug, lambda: pk)
+    data = {'rating': 4, 'comment': 'Gone'}
+    headers = {'Authorization': f'Bearer {user.token.key}'}
+    request = rf.post('/', json.dumps(data), 'application/json', headers=headers)
+    response = views.add_review(request, slug)
+    assert (response.status_code, json.loads(response.content)) == (
+        404,
+        {'error': 'Game not found'},
+    )
+    assert not Review.objects.exists()
+    assert identity.games.get_pk(slug) is None
+
+
+@pytest.mark.django_db
+def test_game_ratings_follow_review_edits_and_deletes(game):
+    other = GameFactory()
+    reviews = [ReviewFactory(game=game, rating=rating) for rating in (5, 4, 4)]
+    assert get_ratings(game) == (3, 13, 4.33)
+    review = Review.objects.get(pk=reviews[0].pk)
+    review.rating = 2
+    review.save()
+    review.save()
+    assert get_ratings(game) == (3, 10, 3.33)
+    review.game = other
+    review.save()
+    assert get_ratings(game) == (2, 8, 4.0)
+    assert get_ratings(other) == (1, 2, 2.0)
+    Review.objects.filter(game=game).delete()
+    assert get_ratings(game) == (0, 0, 0.0)
+
+
+@pytest.mark.django_db
+def test_game_ratings_are_serialized_and_refreshed(rf, game):
+    ReviewFactory(game=game, rating=3)
+    response = views.game_detail(rf.get('/'), game.slug)
+    assert [json.loads(response.content)[key] for key in ('review_count', 'rating_avg')] == [1, 3]
+    ReviewFactory(game=game, rating=4)
+    response = views.game_detail(rf.get('/'), game.slug)
+    assert [json.loads(response.content)[key] for key in ('review_count', 'rating_avg')] == [2, 3.5]
+
+
+@pytest.mark.django_db
+def test_game_list_ordered_by_rating(rf):
+    games = GameFactory.create_batch(5)
+    for game, rating in zip(games, (3, 5, 1, 4, 2)):
+        ReviewFactory(game=game, rating=rating)
+    pages, _ = walk_pages(views.game_list, rf.get('/', {'ordering': '-rating_avg', 'limit': 2}))
+    ids = [game['id'] for page in pages for game in page]
+    assert ids == [games[i].pk for i in (1, 3, 0, 4, 2)]
+
+
+@pytest.mark.django_db
+def test_rebuild_ratings_fixes_drifted_games(rf, capsys):
+    games = GameFactory.create_batch(3)
+    ReviewFactory(game=games[0], rating=5)
+    ReviewFactory(game=games[1], rating=2)
+    views.game_detail(rf.get('/'), games[0].slug)
+    Game.objects.filter(pk=games[0].pk).update(review_count=7, rating_sum=9, rating_avg=1.3)
+    Game.objects.filter(pk=games[2].pk).update(review_count=1, rating_sum=1, rating_avg=1)
+    call_command('rebuild_ratings', batch_size=1)
+    assert capsys.readouterr().out == 'Rebuilt the ratings of 2 games\n'
+    assert [get_ratings(game) for game in games] == [(1, 5, 5.0), (1, 2, 2.0), (0, 0, 0.0)]
+    response = views.game_detail(rf.get('/'), games[0].slug)
+    assert json.loads(response.content)['rating_avg'] == 5.0
+
+
+# ==============================================================================
+# REVIEW STATS
+# ==============================================================================
+
+
+def get_stats(rf, game):
+    response = views.review_stats(rf.get('/'), game.slug)
+    return json.loads(response.content)
+
+
+@pytest.mark.django_db
+def test_review_stats(rf, game, django_assert_num_queries):
+    reviews = [ReviewFactory(game=game, rating=rating) for rating in (5, 4, 4, 1)]
+    ReviewFactory(rating=2)
+    # Formatted as the serializers format created_at (the stored value, in UTC)
+    latest = Review.objects.get(pk=max(reviews, key=lambda review: review.created_at).pk)
+    with django_assert_num_queries(2):
+        response = get_stats(rf, game)
+    assert response.pop('latest') == latest.created_at.isoformat()
+    assert response == {
+        'count': 4,
+        'mean': 3.5,
+        'histogram': {'1': 1, '2': 0, '3': 0, '4': 2, '5': 1},
+    }
+    with django_assert_num_queries(0):
+        assert get_stats(rf, game).items() > response.items()
+
+
+@pytest.mark.django_db
+def test_review_stats_without_reviews(rf, game):
+    expected = {'1': 0, '2': 0, '3': 0, '4': 0, '5': 0}
+    assert get_stats(rf, game) == {'count': 0, 'mean': 0, 'histogram': expected, 'latest': None}
+
+
+@pytest.mark.django_db
+def test_review_stats_fails_when_game_does_not_exist(rf):
+    response = views.review_stats(rf.get('/'), 'test')
+    assert response.status_code == 404
+    assert json.loads(response.content) == {'error': 'Game not found'}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_review_stats_are_invalidated_on_commit(rf, user, game):
+    ReviewFactory(game=game, rating=5)
+    assert get_stats(rf, game)['count'] == 1
+    data = {'rating': 3, 'comment': 'Ok'}
+    headers = {'Authorization': f'Bearer {user.token.key}'}
+    request = rf.post('/', json.dumps(data), 'application/json', headers=headers)
+    review_id = json.loads(views.add_review(request, game.slug).content)['id']
+    assert get_stats(rf, game)['histogram'] == {'1': 0, '2': 0, '3': 1, '4': 0, '5': 1}
+    other = GameFactory()
+    review = Review.objects.get(pk=review_id)
+    review.game = other
+    review.save()
+    assert (get_stats(rf, game)['count'], get_stats(rf, other)['count']) == (1, 1)
+    review.delete()
+    assert get_stats(rf, other)['count'] == 0
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != 'sqlite', reason='EXPLAIN output is SQLite specific')
+def test_review_stats_query_uses_covering_index(game):
+    plan = stats.get_groups(game.pk).explain()
+    assert 'USING COVERING INDEX review_game_rating_idx' in plan
+
+
+# ==============================================================================
+# IDENTITY MAPS
+# ==============================================================================
+
+
+@pytest.mark.django_db
+def test_identity_map_caches_hits_and_misses(game, django_assert_num_queries):
+    with django_assert_num_queries(2):
+        assert identity.games.get_pk(game.slug) == game.pk
+        assert identity.games.get_pk('missing') is None
+    with django_assert_num_queries(0):
+        assert identity.games.get_pk(game.slug) == game.pk
+        assert identity.games.get_pk('missing') is None
+
+
+@pytest.mark.django_db
+def test_identity_map_is_lru_and_expires(django_assert_num_queries):
+    games = GameFactory.create_batch(3)
+    identity_map = IdentityMap(Game, maxsize=2)
+    for game in games:
+        identity_map.get_pk(game.slug)
+    assert list(identity_map.cache.entries) == [games[1].slug, games[2].slug]
+    identity_map.get_pk(games[1].slug)
+    assert list(identity_map.cache.entries) == [games[2].slug, games[1].slug]
+    identity_map.cache.timeout = -1
+    identity_map.get_pk(games[0].slug)
+    with django_assert_num_queries(1):
+        identity_map.get_pk(games[0].slug)
+
+
+@pytest.mark.django_db
+def test_identity_map_follows_signals(game):
+    old_slug = game.slug
+    assert identity.games.get_pk(old_slug) == game.pk
+    assert identity.games.get_pk('new-slug') is None
+    game.slug = 'new-slug'
+    game.save()
+    assert identity.games.get_pk(old_slug) is None
+    assert identity.games.get_pk('new-slug') == game.pk
+    # Anything that invalidates the game's fragments drops its entry
+    ReviewFactory(game=game)
+    assert identity.games.cache.peek('new-slug') is None
+    game.delete()
+    assert identity.games.get_pk('new-slug') is None
+
+
+@pytest.mark.django_db
+def test_related_filters_resolve_slugs_to_ids(rf, no_response_cache, category, platform):
+    game = GameFactory(category=category, platforms=[platform])
+    GameFactory(category=CategoryFactory(), platforms=[PlatformFactory()])
+    params = {'category': category.slug, 'platform': platform.slug}
+    assert get_game_ids(rf, params) == [game.pk]
+    with CaptureQueriesContext(connection) as context:
+        assert get_game_ids(rf, params) == [game.pk]
+    sql = ' '.join(query['sql'] for query in context.captured_queries)
+    assert 'categories_category' not in sql and 'platforms_platform"' not in sql
+    assert f'"category_id" = {category.pk}' in sql
+
+    # Cached misses are dropped when the slug is created
+    assert get_game_ids(rf, {'category': 'new-category'}) == []
+    game.category = CategoryFactory(slug='new-category')
+    game.save()
+    assert get_game_ids(rf, {'category': 'new-category'}) == [game.pk]
+
+
+# ==============================================================================
+# CONDITIONAL GET
+# ==============================================================================
+
+
+def get_conditional(rf, view, *args, **headers):
+    response = view(rf.get('/', headers=headers), *args)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+@pytest.mark.django_db
+def test_game_list_conditional_get(rf, django_assert_num_queries):
+    game = GameFactory()
+    response = get_conditional(rf, views.game_list)
+    etag = response['ETag']
+    # Only the ETag tells writes within the same second apart
+    assert 'Last-Modified' not in response
+    with django_assert_num_queries(0):
+        assert get_conditional(rf, views.game_list, if_none_match=etag).status_code == 304
+    filtered = views.game_list(rf.get('/', {'pegi': 3}))
+    assert filtered['ETag'] != etag
+    game.title = 'New title'
+    game.save()
+    response = get_conditional(rf, views.game_list, if_none_match=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_game_detail_etag_follows_the_game(rf, game, django_assert_num_queries):
+    other = GameFactory()
+    etag = get_conditional(rf, views.game_detail, game.slug)['ETag']
+    with django_assert_num_queries(0):
+        response = get_conditional(rf, views.game_detail, game.slug, if_none_match=etag)
+        assert response.status_code == 304
+    other.save()
+    assert get_conditional(rf, views.game_detail, game.slug, if_none_match=etag).status_code == 304
+    game.category.save()
+    response = get_conditional(rf, views.game_detail, game.slug, if_none_match=etag)
+    assert response.status_code == 200
+    assert 'ETag' not in get_conditional(rf, views.game_detail, 'missing')
+
+
+@pytest.mark.django_db
+def test_review_list_and_detail_conditional_get(rf, review):
+    game = review.game
+    list_etag = get_conditional(rf, views.review_list, game.slug)['ETag']
+    detail_etag = get_conditional(rf, views.review_detail, game.slug, review.pk)['ETag']
+    response = get_conditional(rf, views.review_list, game.slug, if_none_match=list_etag)
+    assert response.status_code == 304
+    review.author.first_name = 'Renamed'
+    review.author.save()
+    response = get_conditional(rf, views.review_list, game.slug, if_none_match=list_etag)
+    assert response.status_code == 200
+    response = get_conditional(
+        rf, views.review_detail, game.slug, review.pk, if_none_match=detail_etag
+    )
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_game_updated_at_follows_reviews(game):
+    updated_at = game.updated_at
+    ReviewFactory(game=game)
+    game.refresh_from_db()
+    assert game.updated_at > updated_at
+
+
+# ==============================================================================
+# RESPONSE CACHE
+# ==============================================================================
+
+
+def get_cached(view, request, *args):
+    response = view(request, *args)
+    content = b''.join(response.streaming_content) if response.streaming else response.content
+    return response.get('X-Cache'), content
+
+
+@pytest.mark.django_db
+def test_game_list_response_cache(rf, django_assert_num_queries):
+    game = GameFactory()
+    GameFactory.create_batch(2)
+    before = responses.get_stats()['total']
+    request = rf.get('/', {'limit': 2})
+    cache, content = get_cached(views.game_list, request)
+    assert cache == 'MISS'
+    with django_assert_num_queries(0):
+        response = views.game_list(rf.get('/', {'limit': 2}))
+    assert (response['X-Cache'], response.content) == ('HIT', content)
+    assert response['Link'].endswith('>; rel="next"')
+    assert response['Content-Type'] == 'application/json'
+    assert get_cached(views.game_list, rf.get('/', {'limit': 3}))[0] == 'MISS'
+    stats = responses.get_stats()
+    assert stats['games.views.game_list']['hits'] >= 1
+    assert stats['total']['misses'] == before['misses'] + 2
+    # Any write to the games moves their generation on
+    game.title = 'New title'
+    game.save()
+    cache, new_content = get_cached(views.game_list, rf.get('/', {'limit': 2}))
+    assert cache == 'MISS'
+    assert b'New title' in new_content
+
+
+@pytest.mark.django_db
+def test_game_detail_response_cache_is_per_game(rf, game):
+    other = GameFactory()
+    assert get_cached(views.game_detail, rf.get('/'), game.slug)[0] == 'MISS'
+    other.save()
+    assert get_cached(views.game_detail, rf.get('/'), game.slug)[0] == 'HIT'
+    ReviewFactory(game=game)
+    cache, content = get_cached(views.game_detail, rf.get('/'), game.slug)
+    assert cache == 'MISS'
+    assert json.loads(content)['review_count'] == 1
+
+
+@pytest.mark.django_db
+def test_review_list_response_cache(rf, review):
+    slug = review.game.slug
+    assert get_cached(views.review_list, rf.get('/'), slug)[0] == 'MISS'
+    assert get_cached(views.review_list, rf.get('/'), slug)[0] == 'HIT'
+    review.author.save()
+    assert get_cached(views.review_list, rf.get('/'), slug)[0] == 'MISS'
+
+
+@pytest.mark.django_db
+def test_list_response_cache_under_asgi(review):
+    # Served by the sync views in ASGI's thread pool, which stream async iterators there
+    get = async_to_sync(AsyncClient().get)
+    for url in (reverse(views.game_list), reverse(views.review_list, args=[review.game.slug])):
+        miss, hit = get(url), get(url)
+        assert (miss.status_code, miss['X-Cache'], hit['X-Cache']) == (200, 'MISS', 'HIT')
+        assert hit.content == miss.content
+        assert len(json.loads(hit.content)) == 1
+
+
+@pytest.mark.django_db
+def test_response_cache_skips_errors_and_authenticated_requests(rf, game):
+    assert get_cached(views.game_detail, rf.get('/'), 'missing')[0] is None
+    request = rf.get('/', headers={'Authorization': 'Bearer x'})
+    assert get_cached(views.game_detail, request, game.slug)[0] is None
+    before = responses.get_stats()['total']
+    for _ in range(2):
+        assert get_cached(views.game_list, rf.get('/', {'ordering': 'x'}))[0] is None
+    assert responses.get_stats()['total'] == {**before, 'misses': before['misses'] + 2}
@@ -1,10 +1,17 @@
+import io
+import sqlite3
+import threading
 import uuid
 from decimal import Decimal
 
 import pytest
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
 
-from factories import GameFactory, OrderFactory
-from orders.models import Order
+from factories import GameFactory, OrderFactory, UserFactory
+from games import stock
+from games.models import Game, StockShard
+from orders.models import Order, OrderGame
 from tests import conftest
 
 from .helpers import compare_games, datetime_isoformats_are_close, get_json, post_json
@@ -549,3 +556,271 @@ def test_pay_order_fails_when_method_is_not_allowed(client):
     url = conftest.ORDER_PAY_URL.format(order_pk=1)
     status, _ = get_json(client, url)
     assert status == 405
+
+
+# ==============================================================================
+# STOCK RESERVATION
+# ==============================================================================
+
+
+def use_file_db(tmp_path, monkeypatch) -> str:
+    """Copy the test database to a file, where the connections of new threads will go."""
+    path = str(tmp_path / 'stress.sqlite3')
+    connection.ensure_connection()
+    target = sqlite3.connect(path)
+    connection.connection.backup(target)
+    target.close()
+    monkeypatch.setitem(connections.settings[DEFAULT_DB_ALIAS], 'NAME', path)
+    return path
+
+
+def run_in_threads(function, n: int) -> list:
+    results, errors = [None] * n, []
+    barrier = threading.Barrier(n)
+
+    def run(i):
+        try:
+            barrier.wait()
+            results[i] = function(i)
+        except Exception as err:
+            errors.append(err)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    return results
+
+
+@pytest.mark.django_db
+def test_add_game_reserves_stock(user):
+    game = GameFactory(stock=1)
+    order = OrderFactory(user=user, status=Order.Status.INITIATED)
+    assert order.add_game(game.pk)
+    # Adding it again doesn't take another copy
+    assert order.add_game(game.pk)
+    game.refresh_from_db()
+    assert game.stock == 0
+    assert not OrderFactory(user=user, status=Order.Status.INITIATED).add_game(game.pk)
+    assert list(order.games.all()) == [game]
+
+
+@pytest.mark.django_db
+def test_add_game_tells_missing_games_from_sold_out_ones(user):
+    order = OrderFactory(user=user, status=Order.Status.INITIATED)
+    assert order.add_game(GameFactory(stock=0).pk) is False
+    with pytest.raises(Game.DoesNotExist):
+        order.add_game(0)
+    assert order.games.count() == 0
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    'status', [Order.Status.CONFIRMED, Order.Status.PAID, Order.Status.CANCELLED]
+)
+def test_add_game_fails_unless_order_is_initiated(user, status):
+    game = GameFactory(stock=1)
+    order = OrderFactory(user=user, status=status)
+    with pytest.raises(ValueError, match='Orders can only be modified when initiated'):
+        order.add_game(game.pk)
+    game.refresh_from_db()
+    assert (game.stock, order.games.count()) == (1, 0)
+
+
+@pytest.mark.django_db
+def test_cancel_releases_reserved_stock(user):
+    games = [GameFactory(stock=stock) for stock in (1, 5)]
+    order = OrderFactory(user=user, status=Order.Status.INITIATED)
+    for game in games:
+        order.add_game(game.pk)
+    assert order.cancel()
+    assert not order.cancel()
+    assert list(Game.objects.order_by('pk').values_list('stock', flat=True)) == [1, 5]
+    assert Order.objects.get(pk=order.pk).status == Order.Status.CANCELLED
+    confirmed = OrderFactory(user=user, status=Order.Status.CONFIRMED, games=games)
+    assert not confirmed.cancel()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.skipif(connection.vendor != 'sqlite', reason='Copies an SQLite database to a file')
+@pytest.mark.parametrize('shards', [0, 4])
+def test_concurrent_reservations_never_oversell(tmp_path, monkeypatch, shards):
+    workers, copies = 32, 10
+    game = GameFactory(stock=copies)
+    stock.set_shards(game.pk, shards)
+    orders = OrderFactory.create_batch(workers, status=Order.Status.INITIATED)
+    path = use_file_db(tmp_path, monkeypatch)
+
+    reserved = run_in_threads(lambda i: orders[i].add_game(game.pk), workers)
+    with sqlite3.connect(path) as db:
+        sql = 'SELECT COUNT(*) FROM orders_order_games WHERE game_id = ?'
+        (in_orders,) = db.execute(sql, [game.pk]).fetchone()
+    assert (sum(reserved), in_orders, get_stock(path, game)) == (copies, copies, 0)
+
+    # Each order cancelled twice at once: its copies go back exactly once
+    cancelled = run_in_threads(lambda i: orders[i % workers].cancel(), 2 * workers)
+    assert (sum(cancelled), get_stock(path, game)) == (workers, copies)
+
+
+def get_stock(path: str, game) -> int:
+    with sqlite3.connect(path) as db:
+        sql = 'SELECT stock FROM games_game WHERE id = ? AND stock_shards = 0'
+        sql += ' UNION ALL SELECT SUM(stock) FROM games_stockshard WHERE game_id = ?'
+        return sum(row[0] or 0 for row in db.execute(sql, [game.pk, game.pk]))
+
+
+def get_shard_stocks(game) -> list[int]:
+    return list(
+        StockShard.objects.filter(game=game).order_by('index').values_list('stock', flat=True)
+    )
+
+
+@pytest.mark.django_db
+def test_sharded_stock_is_spread_and_reconciled():
+    game = GameFactory(stock=10)
+    stock.set_shards(game.pk, 4)
+    assert get_shard_stocks(game) == [3, 3, 2, 2]
+    assert all(stock.reserve(game.pk) for _ in range(10))
+    assert not stock.reserve(game.pk)
+    assert get_shard_stocks(game) == [0, 0, 0, 0]
+    assert stock.get_available(game.pk) == 0
+
+    # Game.stock only catches up on reconciliation
+    game.refresh_from_db()
+    assert game.stock == 10
+    call_command('reconcile_stock', stdout=io.StringIO())
+    game.refresh_from_db()
+    assert game.stock == 0
+
+    stock.release([game.pk])
+    assert get_shard_stocks(game) == [1, 0, 0, 0]
+    stock.set_shards(game.pk, 0)
+    game.refresh_from_db()
+    assert (game.stock, game.stock_shards, get_shard_stocks(game)) == (1, 0, [])
+
+
+@pytest.mark.django_db
+def test_reservations_follow_mode_changes_of_other_processes(django_assert_num_queries):
+    game = GameFactory(stock=4)
+    stock.set_shards(game.pk, 2)
+    # As cached by a process that hasn't seen the game sharded
+    stock.shard_counts.get(game.pk, lambda: 0)
+    assert stock.reserve(game.pk)
+    assert stock.shard_counts.peek(game.pk) == 2
+    with django_assert_num_queries(1):
+        assert stock.reserve(game.pk)
+    assert stock.get_available(game.pk) == 2
+
+
+# ==============================================================================
+# STATUS TRANSITIONS
+# ==============================================================================
+
+
+@pytest.mark.django_db
+def test_status_transitions_are_single_conditional_updates(user, django_assert_num_queries):
+    order = OrderFactory(user=user, status=Order.Status.INITIATED)
+    updated_at = order.updated_at
+    assert not Order.transition(order.pk, Order.Status.PAID)
+    with django_assert_num_queries(1):
+        assert Order.transition(order.pk, Order.Status.CONFIRMED, user=user)
+    assert not Order.transition(order.pk, Order.Status.CANCELLED)
+    assert not Order.transition(order.pk, Order.Status.PAID, user=UserFactory())
+    assert Order.transition(order.pk, Order.Status.PAID)
+    assert not Order.transition(order.pk, Order.Status.PAID)
+    order.refresh_from_db()
+    assert order.status == Order.Status.PAID
+    assert order.updated_at > updated_at
+    with pytest.raises(ValueError, match='Invalid status'):
+        Order.transition(order.pk, Order.Status.INITIATED)
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.skipif(connection.vendor != 'sqlite', reason='Copies an SQLite database to a file')
+def test_concurrent_transitions_have_one_winner(tmp_path, monkeypatch):
+    workers = 16
+    confirmed = OrderFactory(status=Order.Status.CONFIRMED)
+    initiated = OrderFactory(status=Order.Status.INITIATED)
+    use_file_db(tmp_path, monkeypatch)
+
+    paid = run_in_threads(lambda i: Order.transition(confirmed.pk, Order.Status.PAID), workers)
+    assert sum(paid) == 1
+
+    # Confirms racing with cancels
+    statuses = [Order.Status.CONFIRMED, Order.Status.CANCELLED]
+    moved = run_in_threads(lambda i: Order.transition(initiated.pk, statuses[i % 2]), workers)
+    assert sum(moved) == 1
+
+
+# ==============================================================================
+# ORDER TOTALS
+# ==============================================================================
+
+
+def get_totals(order) -> tuple[Decimal, int]:
+    order.refresh_from_db()
+    return order.total, order.item_count
+
+
+@pytest.mark.django_db
+def test_order_totals_follow_its_games(user):
+    order = OrderFactory(user=user, status=Order.Status.INITIATED)
+    games = [GameFactory(price=price) for price in (Decimal('10.00'), Decimal('5.50'))]
+    order.games.add(*games)
+    # Saving the instance (stale totals) leaves them alone
+    order.save()
+    assert get_totals(order) == (Decimal('15.50'), 2)
+
+    # Games keep the price they were added with
+    Game.objects.filter(pk=games[0].pk).update(price=Decimal('20.00'))
+    order.games.add(games[0], GameFactory(price=Decimal('1.00')))
+    assert get_totals(order) == (Decimal('16.50'), 3)
+
+    order.games.remove(games[1], GameFactory())
+    assert get_totals(order) == (Decimal('11.00'), 2)
+    other = OrderFactory(user=user, status=Order.Status.INITIATED)
+    games[1].orders.add(order, other)
+    assert get_totals(order) == (Decimal('16.50'), 3)
+    assert get_totals(other) == (Decimal('5.50'), 1)
+    games[1].orders.clear()
+    assert get_totals(order) == (Decimal('11.00'), 2)
+    assert get_totals(other) == (Decimal('0.00'), 0)
+    order.games.clear()
+    assert get_totals(order) == (Decimal('0.00'), 0)
+
+
+@pytest.mark.django_db
+def test_order_totals_are_frozen_once_paid(user, game):
+    order = OrderFactory(user=user, status=Order.Status.CONFIRMED, games=[game])
+    assert Order.transition(order.pk, Order.Status.PAID)
+    order.games.add(GameFactory())
+    order.games.remove(game)
+    assert get_totals(order) == (game.price, 1)
+
+
+@pytest.mark.django_db
+def test_reconcile_order_totals(user):
+    games = [GameFactory(price=price) for price in (Decimal('0.10'), Decimal('0.20'), 3)]
+    unpaid = OrderFactory.create_batch(3, user=user, status=Order.Status.INITIATED, games=games)
+    paid = OrderFactory(user=user, status=Order.Status.PAID, games=games)
+    # Drift: totals overwritten, and an item deleted without signals
+    Order.objects.update(total=0, item_count=0)
+    OrderGame.objects.filter(order=unpaid[0], game=games[2]).delete()
+    OrderGame.objects.filter(order=unpaid[1], game=games[0]).update(price=None)
+
+    out = io.StringIO()
+    call_command('reconcile_order_totals', batch_size=2, stdout=out)
+    assert out.getvalue() == 'Reconciled the totals of 3 orders\n'
+    assert [get_totals(order) for order in unpaid] == [
+        (Decimal('0.30'), 2),
+        (Decimal('3.30'), 3),
+        (Decimal('3.30'), 3),
+    ]
+    assert get_totals(paid) == (Decimal('0.00'), 0)
+    out = io.StringIO()
+    call_command('reconcile_order_totals', stdout=out)
+    assert out.getvalue() == 'Reconciled the totals of 0 orders\n'
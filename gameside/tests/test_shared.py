@@ -0,0 +1,667 @@
+import asyncio
+import dataclasses
+import enum
+import json
+import threading
+import time
+import uuid
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import request_finished
+from django.db import close_old_connections, connection, transaction
+from django.db.models.signals import post_delete
+from django.http import HttpResponse
+from django.test import AsyncClient, AsyncRequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from factories import CategoryFactory, GameFactory, OrderFactory, PlatformFactory, ReviewFactory
+from games import views
+from games.models import Game, Review
+from games.serializers import GameSerializer, ReviewSerializer
+from orders.models import Order
+from shared import checks, encoders, fragments, querycache, responses, versions
+from shared.serializers import get_fieldsets
+from shared.singleflight import SingleFlight
+
+
+@pytest.fixture(params=sorted(encoders.BACKENDS))
+def json_backend(request):
+    previous = encoders.backend
+    encoders.set_backend(request.param)
+    yield request.param
+    encoders.set_backend(previous)
+
+
+# ==============================================================================
+# Projection
+# ==============================================================================
+
+
+@pytest.mark.django_db
+def test_serializer_outputs_declared_fields_in_order(game):
+    response = GameSerializer(game).serialize()
+    assert list(response) == list(GameSerializer._declared_fields)
+    assert response['category']['id'] == game.category.pk
+
+
+@pytest.mark.django_db
+def test_serializer_projection_skips_excluded_fields(django_assert_num_queries):
+    GameFactory.create_batch(3)
+    serializer = GameSerializer(Game.objects.all(), fields=['id', 'slug'])
+    with django_assert_num_queries(1):
+        response = serializer.serialize()
+    assert all(list(game) == ['id', 'slug'] for game in response)
+
+
+@pytest.mark.django_db
+def test_serializer_projection_pushes_only_into_queryset(game):
+    serializer = GameSerializer(Game.objects.all(), fields=['id', 'title', 'cover'])
+    instance = next(iter(serializer.to_serialize))
+    assert instance.get_deferred_fields() >= {'description', 'price', 'category_id'}
+    assert 'title' not in instance.get_deferred_fields()
+
+
+def test_serializer_plans_are_compiled_once_per_projection():
+    plan = GameSerializer.get_plan(['slug', 'id'])
+    assert GameSerializer.get_plan(['id', 'slug']) is plan
+    assert [name for name, _ in plan.extractors] == ['id', 'slug']
+    assert plan.columns == ('slug',)
+
+
+@pytest.mark.django_db
+def test_serializer_plans_relations_transitively(django_assert_num_queries):
+    ReviewFactory.create_batch(3)
+    plan = ReviewSerializer.get_plan()
+    assert plan.select_related == ('game', 'game__category', 'author')
+    assert plan.prefetch_related == ('game__platforms',)
+    serializer = ReviewSerializer(Review.objects.all(), fields=['id', 'game'])
+    with django_assert_num_queries(2):
+        response = serializer.serialize()
+    assert all(review['game']['category'] for review in response)
+
+
+# ==============================================================================
+# Values rows
+# ==============================================================================
+
+
+@pytest.mark.django_db
+def test_values_mode_matches_instance_mode(rf, platform):
+    GameFactory.create_batch(3, platforms=[platform, PlatformFactory()])
+    GameFactory(category=None)
+    ReviewFactory.create_batch(4)
+    request = rf.get('/')
+    for serializer_class, queryset in (
+        (GameSerializer, Game.objects.all()),
+        (ReviewSerializer, Review.objects.all()),
+    ):
+        expected = serializer_class(queryset, request=request).json_response().content
+        serializer = serializer_class(queryset, request=request, values=True)
+        assert serializer.row_plan is not None
+        assert serializer.json_response().content == expected
+        assert b''.join(serializer.iter_json(chunk_size=2)) == expected
+
+
+@pytest.mark.django_db
+def test_values_mode_does_not_build_model_instances(rf, game, monkeypatch):
+    monkeypatch.setattr(Game, 'from_db', None)
+    serializer = GameSerializer(Game.objects.all(), request=rf.get('/'), values=True)
+    assert serializer.serialize()[0]['id'] == game.pk
+
+
+@pytest.mark.django_db
+def test_values_mode_with_projection(django_assert_num_queries):
+    GameFactory.create_batch(3)
+    serializer = GameSerializer(Game.objects.all(), fields=['id', 'category'], values=True)
+    assert serializer.row_plan.columns == [
+        'id',
+        'category__id',
+        'category__name',
+        'category__slug',
+        'category__description',
+        'category__color',
+    ]
+    with django_assert_num_queries(1):
+        response = serializer.serialize()
+    assert all(list(game) == ['id', 'category'] for game in response)
+
+
+# ==============================================================================
+# Streaming
+# ==============================================================================
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('chunk_size', [1, 2, 500])
+def test_streaming_response_matches_json_response(rf, chunk_size):
+    ReviewFactory.create_batch(5)
+    request = rf.get('/')
+    expected = ReviewSerializer(Review.objects.all(), request=request).json_response()
+    response = ReviewSerializer(Review.objects.all(), request=request).streaming_response(
+        chunk_size
+    )
+    assert response.streaming
+    assert response['Content-Type'] == 'application/json'
+    assert b''.join(response.streaming_content) == expected.content
+
+
+@pytest.mark.django_db
+def test_streaming_response_with_empty_queryset(rf):
+    response = GameSerializer(Game.objects.all(), request=rf.get('/')).streaming_response()
+    assert b''.join(response.streaming_content) == b'[]'
+
+
+@pytest.mark.django_db
+def test_streaming_response_is_async_under_asgi():
+    GameFactory.create_batch(3)
+    request = AsyncRequestFactory().get('/')
+    response = GameSerializer(Game.objects.all(), request=request).streaming_response(2)
+    assert response.is_async
+
+    async def consume():
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    expected = GameSerializer(Game.objects.all(), request=request).json_response()
+    assert async_to_sync(consume)() == expected.content
+
+
+# ==============================================================================
+# Encoders
+# ==============================================================================
+
+
+def test_encoders_handle_native_types(json_backend):
+    data = {
+        'price': Decimal('59.90'),
+        'released_at': date(2024, 2, 29),
+        'created_at': datetime(2024, 2, 29, 10, 30, 15, 123456, tzinfo=timezone.utc),
+        'key': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'title': 'Pokémon Red',
+    }
+    encoded = encoders.encode(data)
+    assert isinstance(encoded, bytes)
+    assert json.loads(encoded) == json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+
+
+def test_encoders_backends_produce_identical_bytes():
+    data = [{'id': 1, 'price': Decimal('1.50'), 'nested': {'at': date(2020, 1, 1)}}]
+    assert len({encode(data) for encode in encoders.BACKENDS.values()}) == 1
+
+
+def test_encoders_resolve_handlers_through_the_mro(json_backend):
+    class Price(Decimal):
+        pass
+
+    class Money:
+        def __init__(self, amount):
+            self.amount = amount
+
+    encoders.register(Money, lambda money: f'{money.amount} EUR')
+    try:
+        assert encoders.encode([Price('2.5'), Money(3)]) == b'["2.5","3 EUR"]'
+    finally:
+        encoders.unregister(Money)
+
+
+def test_encoders_apply_handlers_to_passed_through_types(json_backend):
+    @dataclasses.dataclass
+    class Point:
+        x: int
+        y: int
+
+    encoders.register(Point, dataclasses.astuple)
+    encoders.register(date, lambda value: value.strftime('%d/%m/%Y'))
+    try:
+        assert encoders.encode([Point(1, 2), date(2024, 2, 29)]) == b'[[1,2],"29/02/2024"]'
+    finally:
+        encoders.unregister(Point)
+        encoders.register(date, date.isoformat)
+
+
+@pytest.mark.parametrize('type_', [str, uuid.UUID, enum.IntEnum])
+def test_encoders_refuse_handlers_for_natively_encoded_types(type_):
+    with pytest.raises(TypeError):
+        encoders.register(type_, repr)
+
+
+@pytest.mark.django_db
+def test_json_response_writes_encoded_bytes(rf, game, json_backend):
+    response = GameSerializer(game, request=rf.get('/')).json_response()
+    assert response['Content-Type'] == 'application/json'
+    assert response.content == encoders.encode(
+        GameSerializer(game, request=rf.get('/')).serialize()
+    )
+
+
+# ==============================================================================
+# Fragments
+# ==============================================================================
+
+
+def games_json(request) -> list[dict]:
+    return json.loads(GameSerializer(Game.objects.all(), request=request).json_response().content)
+
+
+def reviews_json(request) -> list[dict]:
+    queryset = Review.objects.all()
+    return json.loads(ReviewSerializer(queryset, request=request).json_response().content)
+
+
+@pytest.mark.django_db
+def test_fragments_are_reused_across_responses(rf, django_assert_num_queries):
+    GameFactory.create_batch(3)
+    request = rf.get('/')
+    expected = GameSerializer(Game.objects.all(), request=request).json_response().content
+    with django_assert_num_queries(1):
+        response = GameSerializer(Game.objects.all(), request=request).json_response()
+    assert response.content == expected
+    game = Game.objects.first()
+    with django_assert_num_queries(0):
+        detail = GameSerializer(game, request=request).json_response()
+    assert detail.content == encoders.encode(GameSerializer(game, request=request).serialize())
+
+
+@pytest.mark.django_db
+def test_fragments_are_keyed_by_base_url(rf, game, settings):
+    settings.ALLOWED_HOSTS = ['testserver', 'example.com']
+    GameSerializer(Game.objects.all(), request=rf.get('/')).json_response()
+    request = rf.get('/', HTTP_HOST='example.com')
+    assert games_json(request)[0]['cover'].startswith('http://example.com/')
+
+
+@pytest.mark.django_db
+def test_fragments_are_invalidated_by_game_changes(rf, game, platform):
+    request = rf.get('/')
+    games_json(request)
+    game.title = 'Updated'
+    game.save()
+    assert games_json(request)[0]['title'] == 'Updated'
+    game.platforms.add(platform)
+    assert games_json(request)[0]['platforms'][0]['id'] == platform.pk
+    platform.name = 'Updated'
+    platform.save()
+    assert games_json(request)[0]['platforms'][0]['name'] == 'Updated'
+    platform.games.clear()
+    assert games_json(request)[0]['platforms'] == []
+    game.delete()
+    assert games_json(request) == []
+
+
+@pytest.mark.django_db
+def test_fragments_are_invalidated_by_embedded_category_changes(rf, game):
+    request = rf.get('/')
+    games_json(request)
+    game.category.name = 'Updated'
+    game.category.save()
+    assert games_json(request)[0]['category']['name'] == 'Updated'
+    game.category.delete()
+    assert games_json(request)[0]['category'] is None
+
+
+@pytest.mark.django_db
+def test_fragments_are_invalidated_by_nested_objects_in_reviews(rf, review):
+    request = rf.get('/')
+    reviews_json(request)
+    review.author.username = 'updated'
+    review.author.save()
+    assert reviews_json(request)[0]['author']['username'] == 'updated'
+    review.game.category.color = '#000000'
+    review.game.category.save()
+    assert reviews_json(request)[0]['game']['category']['color'] == '#000000'
+    review.rating = 1 if review.rating != 1 else 2
+    review.save()
+    assert reviews_json(request)[0]['rating'] == review.rating
+
+
+@pytest.mark.django_db(transaction=True)
+def test_fragments_are_invalidated_again_when_the_write_commits(game):
+    with transaction.atomic():
+        ReviewFactory(game=game)
+        # Another connection can cache the game as it was before the review until the commit
+        cached = fragments.get_versions({(Game, game.pk)})
+    assert fragments.get_versions({(Game, game.pk)}) != cached
+
+
+def test_table_versions_survive_eviction(monkeypatch):
+    cache = fragments.get_cache()
+    # Seeded by another process, and evicted before it could be read
+    monkeypatch.setattr(cache, 'add', lambda *args, **kwargs: False)
+    monkeypatch.setattr(cache, 'get', lambda key, default=None, version=None: default)
+    assert isinstance(versions.get_versions([Game])[0], int)
+
+
+@pytest.mark.parametrize(
+    ('backend', 'single_process', 'errors'),
+    [
+        ('django.core.cache.backends.locmem.LocMemCache', False, ['shared.E001']),
+        ('django.core.cache.backends.locmem.LocMemCache', True, []),
+        ('django.core.cache.backends.redis.RedisCache', False, []),
+    ],
+)
+def test_versions_need_a_shared_cache(settings, backend, single_process, errors):
+    settings.CACHES = {**settings.CACHES, fragments.FRAGMENT_CACHE: {'BACKEND': backend}}
+    settings.SINGLE_PROCESS = single_process
+    assert [error.id for error in checks.check_versions_cache(None)] == errors
+
+
+# ==============================================================================
+# Side-loading
+# ==============================================================================
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('values', [False, True])
+def test_sideload_includes_each_nested_object_once(rf, game, user, values):
+    ReviewFactory.create_batch(4, game=game, author=user)
+    ReviewFactory()
+    serializer = ReviewSerializer(
+        Review.objects.order_by('pk'), request=rf.get('/'), values=values, sideload=True
+    )
+    response = json.loads(serializer.json_response().content)
+    assert [review['game'] for review in response['data'][:4]] == [game.pk] * 4
+    assert [review['author'] for review in response['data'][:4]] == [user.pk] * 4
+    assert [g['id'] for g in response['included']['game']] == [game.pk, game.pk + 1]
+    assert len(response['included']['author']) == 2
+    game.refresh_from_db()
+    expected_game = GameSerializer(game, request=serializer.request).to_json()
+    assert response['included']['game'][0] == json.loads(expected_game)
+
+
+@pytest.mark.django_db
+def test_sideload_streaming_matches_json_response(rf):
+    ReviewFactory.create_batch(3)
+    request = rf.get('/')
+    queryset = Review.objects.all()
+    expected = ReviewSerializer(queryset, request=request, sideload=True).json_response().content
+    serializer = ReviewSerializer(queryset, request=request, values=True, sideload=True)
+    assert b''.join(serializer.iter_json(chunk_size=2)) == expected
+
+
+@pytest.mark.django_db
+def test_nested_objects_are_serialized_once_per_response(rf, game, monkeypatch):
+    ReviewFactory.create_batch(3, game=game)
+    calls = []
+    serialize_instance = GameSerializer.serialize_instance
+    monkeypatch.setattr(
+        GameSerializer,
+        'serialize_instance',
+        lambda self, instance: calls.append(instance.pk) or serialize_instance(self, instance),
+    )
+    ReviewSerializer(Review.objects.all(), request=rf.get('/')).serialize()
+    assert calls == [game.pk]
+
+
+# ==============================================================================
+# Sparse fieldsets
+# ==============================================================================
+
+
+def test_get_fieldsets_parses_top_level_and_nested_fields(rf):
+    request = rf.get('/', {'fields': 'id,title,', 'fields[category]': 'name', 'other': 'x'})
+    assert get_fieldsets(request) == (['id', 'title'], {'category': ['name']})
+
+
+@pytest.mark.django_db
+def test_nested_fieldsets_push_down_nested_columns(game):
+    nested_fields = {'category': ['name']}
+    serializer = GameSerializer(
+        Game.objects.all(), fields=['id', 'category'], nested_fields=nested_fields
+    )
+    assert serializer.plan.columns == ('category', 'category__name')
+    assert serializer.serialize() == [{'id': game.pk, 'category': {'name': game.category.name}}]
+    rows = GameSerializer(
+        Game.objects.all(), fields=['id', 'category'], nested_fields=nested_fields, values=True
+    )
+    assert rows.row_plan.columns == ['id', 'category__id', 'category__name']
+    assert rows.serialize() == serializer.serialize()
+
+
+# ==============================================================================
+# Single-flight and stale-while-revalidate
+# ==============================================================================
+
+
+def run_in_threads(function, n: int = 8) -> list:
+    results = [None] * n
+
+    def run(i):
+        results[i] = function()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_single_flight_coalesces_threads():
+    flight, calls = SingleFlight(), []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'result'
+
+    results = run_in_threads(lambda: flight.do('key', compute))
+    assert len(calls) == 1
+    assert sorted(results) == [('result', False)] + [('result', True)] * 7
+    assert flight.do('key', compute) == ('result', False)
+    assert not flight.calls
+
+
+def test_single_flight_shares_errors():
+    flight = SingleFlight()
+
+    def compute():
+        time.sleep(0.1)
+        raise ValueError('boom')
+
+    def call():
+        try:
+            flight.do('key', compute)
+        except ValueError as err:
+            return str(err)
+
+    assert run_in_threads(call, 4) == ['boom'] * 4
+
+
+def test_single_flight_coalesces_coroutines():
+    flight, calls = SingleFlight(), []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'result'
+
+    async def main():
+        return await asyncio.gather(*[flight.ado('key', compute) for _ in range(8)])
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert sorted(results) == [('result', False)] + [('result', True)] * 7
+
+
+def counting_view(calls: list, delay: float = 0):
+    @responses.cache_response(Game)
+    def view(request):
+        calls.append(1)
+        time.sleep(delay)
+        return HttpResponse(str(len(calls)))
+
+    return view
+
+
+def test_cache_response_coalesces_concurrent_misses(rf):
+    calls = []
+    view = counting_view(calls, delay=0.1)
+    results = run_in_threads(lambda: view(rf.get('/coalesced')))
+    assert len(calls) == 1
+    assert sorted(response['X-Cache'] for response in results) == ['HIT'] * 7 + ['MISS']
+    assert {response.content for response in results} == {b'1'}
+    assert responses.get_stats()['tests.test_shared.view']['coalesced'] >= 7
+
+
+def test_cache_response_waits_for_another_process_filling_a_miss(rf, monkeypatch):
+    calls = []
+    view = counting_view(calls)
+    cache = responses.get_cache()
+    key = responses.get_key(rf.get('/filling'), 'tests.test_shared.view', [Game], None, (), {})
+    # Another process holds the lease, and stores its response a bit later
+    cache.add(f'{key}:fill', 1)
+
+    def fill():
+        time.sleep(0.1)
+        responses.store(cache, key, (200, {'Content-Type': 'text/plain'}, b'other'))
+
+    threading.Thread(target=fill).start()
+    response = view(rf.get('/filling'))
+    assert (response['X-Cache'], response.content, calls) == ('HIT', b'other', [])
+
+    # Nor does a process that died holding the lease keep the others waiting for long
+    cache.clear()
+    cache.add(f'{key}:fill', 1)
+    monkeypatch.setattr(responses, 'RESPONSE_CACHE_FILL_WAIT', 0.1)
+    response = view(rf.get('/filling'))
+    assert (response['X-Cache'], response.content, calls) == ('MISS', b'1', [1])
+
+
+# ASGI closes responses (which refreshes stale ones) in a worker thread, with its own connection
+@pytest.mark.django_db(transaction=True)
+def test_cache_response_fills_and_refreshes_under_asgi(game, monkeypatch):
+    url, get = reverse(views.game_list), async_to_sync(AsyncClient().get)
+    request = AsyncRequestFactory().get(url)
+    key = responses.get_key(request, 'games.views.game_list', [Game], None, (), {})
+    cache = responses.get_cache()
+    # Filled by another process holding the lease
+    cache.add(f'{key}:fill', 1)
+    threading.Timer(0.1, responses.store, [cache, key, (200, {}, b'["other"]')]).start()
+    response = get(url)
+    assert (response['X-Cache'], response.content) == ('HIT', b'["other"]')
+
+    # Expired: served stale once, while the response is refreshed after it has been sent
+    cache.clear()
+    monkeypatch.setattr(responses, 'RESPONSE_CACHE_TIMEOUT', 0)
+    assert get(url)['X-Cache'] == 'MISS'
+    monkeypatch.setattr(responses, 'RESPONSE_CACHE_TIMEOUT', 60)
+    stale = get(url)
+    assert stale['X-Cache'] == 'STALE'
+    fresh = get(url)
+    assert (fresh['X-Cache'], fresh.content) == ('HIT', stale.content)
+    assert json.loads(fresh.content)[0]['id'] == game.pk
+
+
+def test_cache_response_serves_stale_while_one_worker_refreshes(rf, monkeypatch):
+    calls = []
+    view = counting_view(calls)
+    monkeypatch.setattr(responses, 'RESPONSE_CACHE_TIMEOUT', 0)
+    assert view(rf.get('/stale'))['X-Cache'] == 'MISS'
+    stale, other = view(rf.get('/stale')), view(rf.get('/stale'))
+    assert (stale['X-Cache'], stale.content, other['X-Cache']) == ('STALE', b'1', 'STALE')
+    # Only the first stale hit holds the refresh lease
+    assert stale.refresh and not other.refresh
+    assert len(calls) == 1
+    monkeypatch.setattr(responses, 'RESPONSE_CACHE_TIMEOUT', 60)
+    # As the test client does, keep request_finished from closing the database connections
+    request_finished.disconnect(close_old_connections)
+    try:
+        stale.close()
+    finally:
+        request_finished.connect(close_old_connections)
+    assert len(calls) == 2
+    response = view(rf.get('/stale'))
+    assert (response['X-Cache'], response.content) == ('HIT', b'2')
+
+
+def test_cache_response_async_view(monkeypatch):
+    calls = []
+
+    @responses.cache_response(Game)
+    async def view(request):
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return HttpResponse(str(len(calls)))
+
+    async def main():
+        factory = AsyncRequestFactory()
+        first = await asyncio.gather(*[view(factory.get('/async')) for _ in range(5)])
+        stale = await view(factory.get('/async'))
+        monkeypatch.setattr(responses, 'RESPONSE_CACHE_TIMEOUT', 60)
+        await asyncio.gather(*responses.tasks)
+        return first, stale, await view(factory.get('/async'))
+
+    monkeypatch.setattr(responses, 'RESPONSE_CACHE_TIMEOUT', 0)
+    first, stale, fresh = asyncio.run(main())
+    assert sorted(response['X-Cache'] for response in first) == ['HIT'] * 4 + ['MISS']
+    assert (stale['X-Cache'], stale.content) == ('STALE', b'1')
+    assert (fresh['X-Cache'], fresh.content) == ('HIT', b'2')
+    assert len(calls) == 2
+
+
+# ==============================================================================
+# Query cache
+# ==============================================================================
+
+
+def count_fetch(queryset) -> tuple[list, int]:
+    with CaptureQueriesContext(connection) as context:
+        rows = list(queryset.all())
+    return rows, len(context)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_cached_queryset_hits_until_a_table_changes(game):
+    games = Game.objects.filter(slug=game.slug).cached()
+    assert count_fetch(games) == ([game], 1)
+    assert count_fetch(Game.objects.filter(slug=game.slug).cached()) == ([game], 0)
+    # values() and values_list() compile to the same SQL but are cached apart
+    assert count_fetch(games.values_list('title', flat=True)) == ([game.title], 1)
+    assert count_fetch(games.values('title')) == ([{'title': game.title}], 1)
+    CategoryFactory()
+    assert count_fetch(games)[1] == 0
+    Game.objects.filter(pk=game.pk).update(title='New title')
+    assert count_fetch(games)[0][0].title == 'New title'
+    assert count_fetch(Game.objects.filter(pk__in=[]).cached()) == ([], 0)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_cached_queryset_follows_joined_and_subqueried_tables(game, platform):
+    reviewed = Game.objects.filter(pk__in=Review.objects.values('game')).cached()
+    by_platform = Game.objects.filter(platforms__slug=platform.slug).cached()
+    assert count_fetch(reviewed) == ([], 1)
+    assert count_fetch(by_platform) == ([], 1)
+    assert (count_fetch(reviewed)[1], count_fetch(by_platform)[1]) == (0, 0)
+    ReviewFactory(game=game)
+    game.platforms.add(platform)
+    assert count_fetch(reviewed) == ([game], 1)
+    assert count_fetch(by_platform) == ([game], 1)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_cached_queryset_only_tracks_cached_models(game, user):
+    assert {'games_game', 'games_game_platforms', 'users_token'} <= querycache.get_tracked_tables()
+    assert 'orders_order' not in querycache.get_tracked_tables()
+    # Writes to other models neither touch generations nor keep their deletes from being fast
+    OrderFactory(user=user).delete()
+    assert not querycache.get_cache().get(querycache.generation_key('orders_order'))
+    assert not post_delete.has_listeners(Order)
+    # So queries that read their tables aren't cached
+    ordered = Game.objects.filter(orders__user=user).cached()
+    assert (count_fetch(ordered)[1], count_fetch(ordered)[1]) == (1, 1)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_cached_queryset_is_bypassed_in_transactions(game):
+    games = Game.objects.filter(pk=game.pk).cached().values_list('title', flat=True)
+    list(games)
+    with transaction.atomic():
+        Game.objects.filter(pk=game.pk).update(title='Uncommitted')
+        assert count_fetch(games) == (['Uncommitted'], 1)
+        assert count_fetch(games) == (['Uncommitted'], 1)
+    assert count_fetch(games) == (['Uncommitted'], 1)
+    assert count_fetch(games) == (['Uncommitted'], 0)
@@ -1,6 +1,11 @@
+import json
+import uuid
+
 import pytest
+from django.http import JsonResponse
 
 from tests import conftest
+from users import auth
 from users.models import Token
 
 from .helpers import get_json, post_json
@@ -46,3 +51,54 @@ def test_auth_fails_when_method_is_not_allowed(client):
     status, response = get_json(client, url)
     assert status == 405
     assert response == {'error': 'Method not allowed'}
+
+
+# ==============================================================================
+# Bearer token authentication
+# ==============================================================================
+
+
+@auth.token_required
+def whoami(request):
+    return JsonResponse({'id': request.api_user.pk})
+
+
+def call_whoami(rf, token: str = '') -> tuple[int, dict]:
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    response = whoami(rf.get('/', headers=headers))
+    return response.status_code, json.loads(response.content)
+
+
+@pytest.mark.django_db
+def test_token_user_is_loaded_once_and_cached(rf, user, django_assert_num_queries):
+    with django_assert_num_queries(1) as context:
+        assert call_whoami(rf, user.token.key) == (200, {'id': user.pk})
+    assert 'JOIN' in context.captured_queries[0]['sql']
+    with django_assert_num_queries(0):
+        assert call_whoami(rf, user.token.key) == (200, {'id': user.pk})
+
+
+@pytest.mark.django_db
+def test_token_required_rejects_invalid_and_unregistered_tokens(rf, user):
+    assert call_whoami(rf) == (400, {'error': 'Invalid authentication token'})
+    assert call_whoami(rf, 'invalid-token') == (400, {'error': 'Invalid authentication token'})
+    response = whoami(rf.get('/', headers={'Authorization': f'Basic {user.token.key}'}))
+    assert response.status_code == 400
+    unregistered = (401, {'error': 'Unregistered authentication token'})
+    assert call_whoami(rf, str(uuid.uuid4())) == unregistered
+
+
+@pytest.mark.django_db
+def test_token_cache_follows_rotation_and_deletion(rf, user):
+    token = Token.objects.get(user=user)
+    old_key, new_key = str(token.key), uuid.uuid4()
+    unregistered = (401, {'error': 'Unregistered authentication token'})
+    assert call_whoami(rf, old_key)[0] == 200
+    # The new key was a cached miss
+    assert call_whoami(rf, str(new_key)) == unregistered
+    token.key = new_key
+    token.save()
+    assert call_whoami(rf, old_key) == unregistered
+    assert call_whoami(rf, str(new_key))[0] == 200
+    token.delete()
+    assert call_whoami(rf, str(new_key)) == unregistered
@@ -0,0 +1,83 @@
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import JsonResponse
+
+from shared.lru import LRUCache
+
+from .models import Token
+
+User = get_user_model()
+
+# Token key -> user (None for unregistered keys), so warm authenticated requests skip the database.
+# Entries go as soon as this process sees the token or its user change; the timeout bounds how long
+# other processes keep using a rotated or deleted token.
+AUTH_CACHE_SIZE = getattr(settings, 'AUTH_CACHE_SIZE', 4096)
+AUTH_CACHE_TIMEOUT = getattr(settings, 'AUTH_CACHE_TIMEOUT', 60)
+
+users = LRUCache(AUTH_CACHE_SIZE, AUTH_CACHE_TIMEOUT)
+
+
+class AuthenticationError(Exception):
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+def get_token_key(request) -> uuid.UUID:
+    scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+    try:
+        if scheme.lower() != 'bearer':
+            raise ValueError
+        return uuid.UUID(key.strip())
+    except ValueError:
+        raise AuthenticationError('Invalid authentication token', 400)
+
+
+def load_user(key: uuid.UUID) -> User | None:
+    # Token and user in one query
+    token = Token.objects.select_related('user').filter(key=key).first()
+    return token.user if token else None
+
+
+def authenticate(request) -> User:
+    """The user of the request's bearer token, also left in `request.api_user`.
+
+    The user instance is shared with other requests of this process: read it, don't change it.
+    """
+    if not hasattr(request, 'api_user'):
+        key = get_token_key(request)
+        if (user := users.get(key, lambda: load_user(key))) is None:
+            raise AuthenticationError('Unregistered authentication token', 401)
+        request.api_user = user
+    return request.api_user
+
+
+def token_required(view):
+    """Answer 400/401 unless the request carries a registered bearer token."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            authenticate(request)
+        except AuthenticationError as err:
+            return JsonResponse({'error': str(err)}, status=err.status)
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+@receiver([post_save, post_delete], sender=Token)
+def forget_token(sender, instance: Token, **kwargs) -> None:
+    # The new key may be a cached miss; a rotated (replaced) key is found by its user
+    keys = [uuid.UUID(str(instance.key))] if instance.key else []
+    users.discard(keys, where=lambda user: user and user.pk == instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_user(sender, instance: User, **kwargs) -> None:
+    users.discard(where=lambda user: user and user.pk == instance.pk)
@@ -1,12 +1,9 @@
-from shared.serializers import BaseSerializer
+from shared.serializers import BaseSerializer, Field
 
 
 class UserSerializer(BaseSerializer):
-    def serialize_instance(self, instance) -> dict:
-        return {
-            'id': instance.pk,
-            'username': instance.username,
-            'first_name': instance.first_name,
-            'last_name': instance.last_name,
-            'email': instance.email,
-        }
+    id = Field('pk')
+    username = Field()
+    first_name = Field()
+    last_name = Field()
+    email = Field()